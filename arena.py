@@ -0,0 +1,225 @@
+'''
+Arena mode for pascal9: the parser writes every node into one flat
+NodeArena (typed arrays) instead of allocating an object per node.
+
+    arena = ArenaParser(Lexer(text)).parse()
+    ArenaInterpreter(arena).interpret()
+'''
+import operator
+from array import array
+
+from environment import Environment
+from pascal9 import Parser, SCANNERS, TYPE_CODES, PLUS, MINUS, MUL, DIV
+
+# Node kinds; the names match the pascal9 AST classes and double as visitor method suffixes
+KIND_NAMES = ('Num', 'Var', 'BinOp', 'UnaryOp', 'Compound', 'Assign', 'NoOp')
+KIND_NUM, KIND_VAR, KIND_BINOP, KIND_UNARYOP, KIND_COMPOUND, KIND_ASSIGN, KIND_NOOP = range(len(KIND_NAMES))
+
+class NodeArena(object):
+    '''
+    Flat node table. Node i is described by kinds[i], ops[i], first[i]
+    and second[i]:
+
+        Num       first: literal index (the integer)
+        Var       first: literal index (the name)
+        BinOp     ops: operator type code, first: left node, second: right node
+        UnaryOp   ops: operator type code, first: operand node
+        Compound  first: start in children, second: child count
+        Assign    first: Var node, second: expression node
+        NoOp      -
+
+    Literals are interned, so every use of a name or number shares one slot.
+    '''
+    def __init__(self):
+        self.kinds = array('b')
+        self.ops = array('b')
+        self.first = array('i')
+        self.second = array('i')
+        self.children = array('i')
+        self.literals = []
+        self.literal_index = {}
+        self.root = -1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add(self, kind, op=0, first=0, second=0):
+        self.kinds.append(kind)
+        self.ops.append(op)
+        self.first.append(first)
+        self.second.append(second)
+        return len(self.kinds) - 1
+
+    def literal(self, value):
+        # keyed by type too: 2 == 2.0, but they must not share a slot
+        key = (type(value), value)
+        index = self.literal_index.get(key)
+        if index is None:
+            index = self.literal_index[key] = len(self.literals)
+            self.literals.append(value)
+        return index
+
+    def child_nodes(self, index):
+        start = self.first[index]
+        return self.children[start:start + self.second[index]]
+
+class ArenaParser(Parser):
+    '''
+    Same grammar as Parser; node construction writes into self.arena and
+    returns node indices. parse() returns the arena with root set.
+    '''
+    def __init__(self, lexer):
+        Parser.__init__(self, lexer)
+        self.arena = NodeArena()
+
+    def parse(self):
+        self.arena.root = Parser.parse(self)
+        # the interning index is only needed while building
+        self.arena.literal_index = {}
+        return self.arena
+
+    def empty(self):
+        return self.arena.add(KIND_NOOP)
+
+    def make_binop(self, left, op, right):
+        return self.arena.add(KIND_BINOP, TYPE_CODES[op.type], left, right)
+
+    def make_num(self, token):
+        return self.arena.add(KIND_NUM, 0, self.arena.literal(token.value))
+
+    def make_unaryop(self, op, expr):
+        return self.arena.add(KIND_UNARYOP, TYPE_CODES[op.type], expr)
+
+    def make_compound(self, nodes):
+        # nested blocks are finished before their parent, so each
+        # block's children end up contiguous
+        arena = self.arena
+        start = len(arena.children)
+        arena.children.extend(nodes)
+        return arena.add(KIND_COMPOUND, 0, start, len(nodes))
+
+    def make_assign(self, left, op, right):
+        return self.arena.add(KIND_ASSIGN, 0, left, right)
+
+    def make_var(self, token):
+        return self.arena.add(KIND_VAR, 0, self.arena.literal(token.value))
+
+class ArenaVisitor(object):
+    '''
+    NodeVisitor for a NodeArena: visit(index) dispatches on kinds[index]
+    to visit_<KIND_NAME>, through a table of functions built once per
+    visitor class.
+    '''
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.handlers = [getattr(cls, 'visit_' + name, cls.generic_visit) for name in KIND_NAMES]
+
+    def __init__(self, arena):
+        self.arena = arena
+        # the arena's columns, one attribute lookup away from the handlers
+        self.kinds = arena.kinds
+        self.ops = arena.ops
+        self.first = arena.first
+        self.second = arena.second
+        self.literals = arena.literals
+
+    def visit(self, index):
+        return self.handlers[self.kinds[index]](self, index)
+
+    def generic_visit(self, index):
+        raise Exception('No visit_{} method'.format(KIND_NAMES[self.kinds[index]]))
+
+BINARY_OPERATORS = {
+    TYPE_CODES[PLUS]: operator.add,
+    TYPE_CODES[MINUS]: operator.sub,
+    TYPE_CODES[MUL]: operator.mul,
+    TYPE_CODES[DIV]: operator.truediv,
+}
+
+UNARY_OPERATORS = {
+    TYPE_CODES[PLUS]: operator.pos,
+    TYPE_CODES[MINUS]: operator.neg,
+}
+
+class ArenaInterpreter(ArenaVisitor):
+    '''
+    Evaluates a NodeArena with the same semantics as pascal9.Interpreter
+    '''
+    def __init__(self, arena, environment=None):
+        ArenaVisitor.__init__(self, arena)
+        self.GLOBAL_SCOPE = Environment() if environment is None else environment
+
+    # Handlers call the handler of a child straight from the table rather
+    # than through visit(), and read a literal operand in place
+    def visit_BinOp(self, index):
+        kinds = self.kinds
+        first = self.first
+        left = first[index]
+        right = self.second[index]
+        kind = kinds[left]
+        if kind == KIND_NUM:
+            left = self.literals[first[left]]
+        else:
+            left = self.handlers[kind](self, left)
+        kind = kinds[right]
+        if kind == KIND_NUM:
+            right = self.literals[first[right]]
+        else:
+            right = self.handlers[kind](self, right)
+        return BINARY_OPERATORS[self.ops[index]](left, right)
+
+    def visit_Num(self, index):
+        return self.literals[self.first[index]]
+
+    def visit_UnaryOp(self, index):
+        operand = self.first[index]
+        return UNARY_OPERATORS[self.ops[index]](self.handlers[self.kinds[operand]](self, operand))
+
+    def visit_Compound(self, index):
+        handlers = self.handlers
+        kinds = self.kinds
+        for child in self.arena.child_nodes(index):
+            handlers[kinds[child]](self, child)
+
+    def visit_NoOp(self, index):
+        pass
+
+    def visit_Assign(self, index):
+        first = self.first
+        expr = self.second[index]
+        self.GLOBAL_SCOPE[self.literals[first[first[index]]]] = self.handlers[self.kinds[expr]](self, expr)
+
+    def visit_Var(self, index):
+        var_name = self.literals[self.first[index]]
+        try:
+            return self.GLOBAL_SCOPE[var_name]
+        except KeyError:
+            raise NameError(repr(var_name)) from None
+
+    def interpret(self):
+        return self.visit(self.arena.root)
+
+def parse_arena(text, scanner='char'):
+    return ArenaParser(SCANNERS[scanner](text)).parse()
+
+def main():
+    text = '''
+    BEGIN
+        BEGIN
+            number := 2;
+            a := number;
+            b := 10 * a + 10 * number / 4;
+            c := a - - b
+        END;
+
+        x := 11;
+    END.
+    '''
+    arena = parse_arena(text)
+    interpreter = ArenaInterpreter(arena)
+    interpreter.interpret()
+    print("{} nodes, {} literals".format(len(arena), len(arena.literals)))
+    print("Final result: " + str(interpreter.GLOBAL_SCOPE))
+
+if __name__ == '__main__':
+    main()
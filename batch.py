@@ -0,0 +1,117 @@
+'''
+Multi-core batch evaluation of calc8 expressions or pascal9 programs.
+
+A file holds one item per line; a directory holds one item per file.
+Items are spread over a process pool in chunks and the results come
+back in input order, one per item:
+
+    python batch.py calc8 expressions.txt
+    python batch.py pascal9 programs/ --jobs 64
+
+Every output line is "<index>\\t<result>" or "<index>\\terror: <message>";
+a failing item never stops the rest of the batch.
+'''
+import argparse
+import multiprocessing
+import os
+import sys
+
+from cache import ParseCache
+from closures import compile_tree
+
+LANGUAGES = ('calc8', 'pascal9')
+CHUNK_SIZE = 256
+
+# per-worker state, set up once by init_worker
+programs = None
+
+def init_worker(language):
+    '''
+    Runs once in every worker process: imports the front end, creates
+    its compile cache and pushes a sample item through the whole
+    pipeline so the visitor dispatch tables are filled before real work.
+    '''
+    global programs
+    if language == 'calc8':
+        from calc8 import Lexer, Parser
+        sample = '-(1 + 2) * 3 / 4'
+    else:
+        from pascal9 import Lexer, Parser
+        sample = 'BEGIN a := -(1 + 2) * 3 / 4; b := a END.'
+    programs = ParseCache(lambda text: compile_tree(Parser(Lexer(text)).parse()))
+    run(sample)
+    programs.clear()
+
+def run(text):
+    scope = {}
+    value = programs.parse(text)(scope)
+    # a bare expression returns its value, a program leaves its variables
+    return scope if value is None else value
+
+def evaluate_text(text):
+    try:
+        # formatted here, so a result that cannot be (an int over the
+        # str() digit limit) fails this item only
+        return True, str(run(text))
+    except Exception as e:
+        return False, '{}: {}'.format(type(e).__name__, e)
+
+def evaluate_file(path):
+    try:
+        with open(path) as f:
+            text = f.read()
+    except OSError as e:
+        return False, '{}: {}'.format(type(e).__name__, e)
+    return evaluate_text(text)
+
+def items(path):
+    '''
+    (worker function, item) for a file (one item per non-empty line) or
+    a directory (one item per file, by name). Lines are read lazily so
+    huge inputs are never held in memory.
+    '''
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if os.path.isfile(os.path.join(path, name)))
+        return evaluate_file, (os.path.join(path, name) for name in names)
+    def lines():
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+    return evaluate_text, lines()
+
+def evaluate_batch(language, path, jobs=None, chunk_size=CHUNK_SIZE):
+    '''
+    Yields (ok, result text or error message) per item, in input order
+    '''
+    if language not in LANGUAGES:
+        raise ValueError('Unknown language {!r}, expected one of {}'.format(language, LANGUAGES))
+    worker, work = items(path)
+    pool = multiprocessing.Pool(jobs, initializer=init_worker, initargs=(language,))
+    try:
+        for result in pool.imap(worker, work, chunk_size):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate a batch of calc8 expressions or pascal9 programs')
+    parser.add_argument('language', choices=LANGUAGES)
+    parser.add_argument('path', help='a file with one item per line, or a directory with one item per file')
+    parser.add_argument('--jobs', '-j', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='items sent to a worker at a time')
+    args = parser.parse_args()
+    errors = 0
+    for index, (ok, result) in enumerate(evaluate_batch(args.language, args.path, args.jobs, args.chunk_size)):
+        if ok:
+            print('{}\t{}'.format(index, result))
+        else:
+            errors += 1
+            print('{}\terror: {}'.format(index, result))
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
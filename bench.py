@@ -0,0 +1,283 @@
+'''
+Cross-version microbenchmarks for calc1 ... calc8, pascal9 and the
+faster pascal9 engines.
+
+Every workload is a synthetic input for one grammar feature; it runs on
+every engine whose grammar has that feature. Engines of mode 'text' go
+from source text to value (lex, parse and evaluate), engines of mode
+'tree' only evaluate a pascal9 tree parsed beforehand. All engines of a
+workload must agree on the result before anything is timed.
+
+    python bench.py
+    python bench.py --workload flat_sum deep_parens --repeat 7
+
+The table lists per-call times over the repetitions; 'speedup' is
+relative to the first engine of the same mode on the same workload.
+'''
+import argparse
+import statistics
+import sys
+import time
+
+import calc1, calc2, calc3, calc4, calc5, calc6, calc7, calc8, pascal9
+from arena import ArenaInterpreter, ArenaParser
+from closures import compile_tree
+from resolve import SlotInterpreter
+from stackeval import evaluate
+from transpile import transpile
+from vm import compile_bytecode, execute
+
+#=================Workloads=============================
+class Workload(object):
+    '''
+    feature: the grammar feature the input needs, see FEATURES
+    expression: calc-style input, or None for a pascal9-only program
+    program: the same as a pascal9 program; an expression is assigned to x
+    '''
+    def __init__(self, name, feature, expression=None, program=None):
+        self.name = name
+        self.feature = feature
+        self.expression = expression
+        self.program = program if program is not None else 'BEGIN x := {} END.'.format(expression)
+
+def flat_sum(size):
+    return Workload('flat_sum', 'chain', ' + '.join(str(i % 90 + 10) for i in range(size)))
+
+def pair(size):
+    return Workload('pair', 'pair', '{} + {}'.format(size, size * 7))
+
+def mixed_precedence(size):
+    operators = ('+', '*', '-', '/')
+    terms = [str(i % 9 + 1) for i in range(size)]
+    text = terms[0]
+    for i, term in enumerate(terms[1:]):
+        text += ' {} {}'.format(operators[i % 4], term)
+    return Workload('mixed_precedence', 'precedence', text)
+
+def deep_parens(size):
+    return Workload('deep_parens', 'parens', '(' * size + '1 + 2' + ') * 1' * size)
+
+def unary_chain(size):
+    return Workload('unary_chain', 'unary', '- ' * size + '(1 + 2)')
+
+def wide_block(size):
+    names = ['v{}'.format(i) for i in range(16)]
+    statements = ['v0 := 1']
+    for i in range(1, size):
+        statements.append('{} := {} * 2 - {}'.format(names[i % 16], names[(i - 1) % 16], i % 7))
+    return Workload('wide_block', 'blocks', program='BEGIN ' + '; '.join(statements) + ' END.')
+
+def nested_block(size):
+    text = 'x := x * 2'
+    for i in range(size):
+        text = 'BEGIN y{0} := x + {0}; {1}; x := x + y{0} END'.format(i, text)
+    return Workload('nested_block', 'blocks', program='BEGIN x := 1; {} END.'.format(text))
+
+WORKLOADS = (pair, flat_sum, mixed_precedence, deep_parens, unary_chain, wide_block, nested_block)
+DEFAULT_SIZES = {
+    'pair': 12345,
+    'flat_sum': 200,
+    'mixed_precedence': 200,
+    'deep_parens': 100,
+    'unary_chain': 100,
+    'wide_block': 200,
+    'nested_block': 30,
+}
+
+#=================Engines===============================
+# Each grammar level adds to the one before it
+FEATURES = ('pair', 'chain', 'precedence', 'parens', 'unary', 'blocks')
+
+class Engine(object):
+    '''
+    prepare(workload) returns a callable that runs the workload once and
+    returns its result; for pascal9 programs that is the final scope.
+    level: the last entry of FEATURES the grammar supports
+    '''
+    def __init__(self, name, mode, level, prepare):
+        self.name = name
+        self.mode = mode
+        self.features = FEATURES[:FEATURES.index(level) + 1]
+        self.prepare = prepare
+
+    def supports(self, workload):
+        return workload.feature in self.features
+
+def direct(module):
+    # calc1 - calc3 lex inside the interpreter
+    return lambda workload: lambda: module.Interpreter(workload.expression).expr()
+
+def with_lexer(module):
+    return lambda workload: lambda: module.Interpreter(module.Lexer(workload.expression)).expr()
+
+def with_tree(module):
+    return lambda workload: lambda: module.Interpreter(module.Parser(module.Lexer(workload.expression))).interpret()
+
+def pascal9_text(parser_class, scanner='char'):
+    def prepare(workload):
+        def run():
+            interpreter = pascal9.Interpreter(parser_class.from_text(workload.program, scanner))
+            interpreter.interpret()
+            return interpreter.GLOBAL_SCOPE
+        return run
+    return prepare
+
+class BufferedPrattParser(pascal9.PrattParser, pascal9.BufferedParser):
+    pass
+
+def parse_program(workload):
+    return pascal9.Parser(pascal9.Lexer(workload.program)).parse()
+
+def visitor(workload):
+    tree = parse_program(workload)
+    def run():
+        interpreter = pascal9.Interpreter()
+        interpreter.interpret(tree)
+        return interpreter.GLOBAL_SCOPE
+    return run
+
+def slots(workload):
+    tree = parse_program(workload)
+    def run():
+        interpreter = SlotInterpreter()
+        interpreter.interpret(tree)
+        return interpreter.GLOBAL_SCOPE
+    return run
+
+def arena(workload):
+    nodes = ArenaParser(pascal9.Lexer(workload.program)).parse()
+    def run():
+        interpreter = ArenaInterpreter(nodes)
+        interpreter.interpret()
+        return interpreter.GLOBAL_SCOPE
+    return run
+
+def on_scope(compile):
+    # engines that compile the tree once and then run against a scope
+    def prepare(workload):
+        program = compile(parse_program(workload))
+        def run():
+            scope = {}
+            program(scope)
+            return scope
+        return run
+    return prepare
+
+ENGINES = (
+    Engine('calc1', 'text', 'pair', direct(calc1)),
+    Engine('calc2', 'text', 'chain', direct(calc2)),
+    Engine('calc3', 'text', 'chain', direct(calc3)),
+    Engine('calc4', 'text', 'chain', with_lexer(calc4)),
+    Engine('calc5', 'text', 'parens', with_lexer(calc5)),
+    Engine('calc6', 'text', 'parens', with_lexer(calc6)),
+    Engine('calc7', 'text', 'parens', with_tree(calc7)),
+    Engine('calc8', 'text', 'unary', with_tree(calc8)),
+    Engine('pascal9', 'text', 'blocks', pascal9_text(pascal9.Parser)),
+    Engine('pascal9 regex+pratt', 'text', 'blocks', pascal9_text(BufferedPrattParser, 'regex')),
+    Engine('visitor', 'tree', 'blocks', visitor),
+    Engine('slots', 'tree', 'blocks', slots),
+    Engine('arena', 'tree', 'blocks', arena),
+    Engine('stackeval', 'tree', 'blocks', on_scope(lambda tree: lambda scope: evaluate(tree, scope))),
+    Engine('closures', 'tree', 'blocks', on_scope(compile_tree)),
+    Engine('transpile', 'tree', 'blocks', on_scope(lambda tree: transpile(tree).run)),
+    Engine('vm', 'tree', 'blocks', on_scope(lambda tree: lambda scope, code=compile_bytecode(tree): execute(code, scope))),
+)
+
+#=================Harness===============================
+class Result(object):
+    def __init__(self, workload, engine, times, number):
+        self.workload = workload
+        self.engine = engine
+        self.times = times
+        self.number = number
+        self.median = statistics.median(times)
+        self.mean = statistics.mean(times)
+        self.stdev = statistics.stdev(times) if len(times) > 1 else 0.0
+        self.best = min(times)
+
+def outcome(workload, value):
+    # what all engines must agree on
+    if isinstance(value, dict):
+        return value.get('x') if workload.expression is not None else dict(value)
+    return value
+
+def calibrate(run, min_time):
+    # calls per repetition, so one repetition takes at least min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(number):
+            run()
+        if time.perf_counter() - start >= min_time:
+            return number
+        number *= 2
+
+def measure(run, warmup, repeat, min_time):
+    for i in range(warmup):
+        run()
+    number = calibrate(run, min_time)
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            run()
+        times.append((time.perf_counter() - start) / number)
+    return times, number
+
+def run_benchmarks(workloads, engines, warmup=2, repeat=5, min_time=0.05):
+    results = []
+    for workload in workloads:
+        runs = [(engine, engine.prepare(workload)) for engine in engines if engine.supports(workload)]
+        expected = None
+        for engine, run in runs:
+            value = outcome(workload, run())
+            if expected is None:
+                expected = (engine, value)
+            elif value != expected[1]:
+                raise Exception('{}: {} gives {!r}, {} gives {!r}'.format(
+                    workload.name, expected[0].name, expected[1], engine.name, value))
+        for engine, run in runs:
+            times, number = measure(run, warmup, repeat, min_time)
+            results.append(Result(workload, engine, times, number))
+    return results
+
+def format_time(seconds):
+    for unit, scale in (('s', 1.0), ('ms', 1e3), ('us', 1e6)):
+        if seconds >= 1.0 / scale:
+            return '{:8.2f} {:<2}'.format(seconds * scale, unit)
+    return '{:8.0f} ns'.format(seconds * 1e9)
+
+def table(results):
+    lines = ['{:<17} {:<20} {:<5} {:>11} {:>11} {:>8} {:>11} {:>8}'.format(
+        'workload', 'engine', 'mode', 'median', 'mean', 'stdev %', 'min', 'speedup')]
+    baselines = {}
+    for result in results:
+        key = (result.workload.name, result.engine.mode)
+        baseline = baselines.setdefault(key, result.median)
+        lines.append('{:<17} {:<20} {:<5} {} {} {:>8.1f} {} {:>7.2f}x'.format(
+            result.workload.name, result.engine.name, result.engine.mode,
+            format_time(result.median), format_time(result.mean),
+            100.0 * result.stdev / result.mean, format_time(result.best), baseline / result.median))
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark calc1 ... pascal9 and the pascal9 engines')
+    parser.add_argument('--workload', nargs='*', choices=sorted(DEFAULT_SIZES), help='default: all')
+    parser.add_argument('--engine', nargs='*', choices=[engine.name for engine in ENGINES], help='default: all')
+    parser.add_argument('--size', type=int, help='override the size of every workload')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05, help='seconds per repetition at least')
+    args = parser.parse_args()
+    workloads = []
+    for make in WORKLOADS:
+        name = make.__name__
+        if not args.workload or name in args.workload:
+            workloads.append(make(args.size or DEFAULT_SIZES[name]))
+    engines = [engine for engine in ENGINES if not args.engine or engine.name in args.engine]
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    results = run_benchmarks(workloads, engines, args.warmup, args.repeat, args.min_time)
+    print(table(results))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''
+Content-addressed parse cache shared by the calc7 / calc8 / pascal9 front ends.
+
+A bounded LRU from a hash of the source text to its parsed tree, so a
+text seen before skips lexing and parsing entirely:
+
+    cache = ParseCache(lambda text: Parser(Lexer(text)).parse())
+    tree = cache.parse(text)
+'''
+import hashlib
+from collections import OrderedDict
+
+class ParseCache(object):
+    '''
+    parse: text -> tree, the front end's uncached parse
+    optimize: optional tree -> tree pass applied once before caching,
+        e.g. lambda tree: fold_constants(tree)[0]
+    max_entries / max_size: limits on the number of trees and on their
+        total size, measured as the length of their source texts. A text
+        longer than max_size is parsed but never cached.
+    enabled: False bypasses the cache altogether (no lookups, no counters)
+
+    Cached trees are shared by every caller of the same text, so they
+    must not be modified.
+    '''
+    def __init__(self, parse, max_entries=1024, max_size=1 << 20, optimize=None, enabled=True):
+        self.build = parse
+        self.optimize = optimize
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.enabled = enabled
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, text):
+        return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+    def parse(self, text):
+        if not self.enabled:
+            return self.compile(text)
+        key = self.key(text)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+        self.misses += 1
+        # a text that fails to parse raises here and is not cached
+        tree = self.compile(text)
+        size = len(text)
+        if size <= self.max_size and self.max_entries > 0:
+            self.entries[key] = (tree, size)
+            self.size += size
+            self.evict()
+        return tree
+
+    def compile(self, text):
+        tree = self.build(text)
+        if self.optimize is not None:
+            tree = self.optimize(tree)
+        return tree
+
+    def evict(self):
+        # least recently used first
+        while len(self.entries) > self.max_entries or self.size > self.max_size:
+            key, (tree, size) = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
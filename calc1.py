@@ -1,3 +1,5 @@
+from hooks import print_listener, trace_lexer
+
 INTEGER, PLUS, MINUS, EOF = 'INTEGER', 'PLUS', 'MINUS', 'EOF'
 
 class Token(object):
@@ -87,7 +89,6 @@ class Interpreter(object):
         
         left = self.current_token
         self.eat(INTEGER)
-        print("Left " + str(left))
         
         op = self.current_token
         if op.value == '+':
@@ -96,12 +97,10 @@ class Interpreter(object):
             self.eat(MINUS)
         else:
             self.error('Unknow op ' + str(op))
-        print("Op " + str(op))
         
         
         right = self.current_token
         self.eat(INTEGER)
-        print("Right " + str(right))
         
         if op.value == '+':
             result = left.value + right.value
@@ -118,6 +117,7 @@ def main():
         if not text:
             continue
         interpreter = Interpreter(text)
+        trace_lexer(interpreter, print_listener)
         result = interpreter.expr()
         print(result)
         
@@ -1,3 +1,5 @@
+from hooks import print_listener, trace_lexer
+
 INTEGER, PLUS, MINUS, MULTIPLY, DIVIDE, EOF = 'INTEGER', 'PLUS', 'MINUS', 'MULTIPLY', 'DIVIDE', 'EOF'
 
 class Token(object):
@@ -102,7 +104,6 @@ class Interpreter(object):
         
         left = self.current_token
         self.eat(INTEGER)
-        print("Left " + str(left))
         
         result = left.value
         while self.current_token.type != EOF:
@@ -117,12 +118,10 @@ class Interpreter(object):
                 self.eat(DIVIDE)
             else:
                 self.error('Unknow op ' + str(op))
-            print("Op " + str(op))
             
             
             right = self.current_token
             self.eat(INTEGER)
-            print("Right " + str(right))
             
             if op.type == PLUS:
                 result = left.value + right.value
@@ -139,12 +138,13 @@ class Interpreter(object):
 def main():
     while True:
         try:
-            text = raw_input('calc > ')
+            text = input('calc > ')
         except EOFError:
             break
         if not text:
             continue
         interpreter = Interpreter(text)
+        trace_lexer(interpreter, print_listener)
         result = interpreter.expr()
         print(result)
         
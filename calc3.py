@@ -1,3 +1,5 @@
+from hooks import print_listener, trace_lexer
+
 INTEGER, PLUS, MINUS, MULTIPLY, DIVIDE, EOF = 'INTEGER', 'PLUS', 'MINUS', 'MULTIPLY', 'DIVIDE', 'EOF'
 
 class Token(object):
@@ -91,7 +93,6 @@ class Interpreter(object):
     def term(self):
         token = self.current_token
         self.eat(INTEGER)
-        print("INTEGER " + str(token))
         return token.value
         
     def expr(self):
@@ -124,18 +125,18 @@ class Interpreter(object):
                 result = result / self.term()
             else:
                 self.error('Unknow op ' + str(op))
-            print("Op " + str(op))
         return result
     
 def main():
     while True:
         try:
-            text = raw_input('calc > ')
+            text = input('calc > ')
         except EOFError:
             break
         if not text:
             continue
         interpreter = Interpreter(text)
+        trace_lexer(interpreter, print_listener)
         result = interpreter.expr()
         print(result)
         
@@ -1,6 +1,14 @@
+from array import array
+
+from hooks import print_listener, trace_lexer
+
 INTEGER, PLUS, MINUS, MUL, DIV, EOF = ('INTEGER', 'PLUS', 'MINUS', 'MUL', 'DIV', 'EOF')
+TOKEN_TYPES = (INTEGER, PLUS, MINUS, MUL, DIV, EOF)  # index in this tuple is the type code
+TYPE_CODES = dict((type, code) for code, type in enumerate(TOKEN_TYPES))
 
 class Token(object):
+    __slots__ = ('type', 'value')
+
     def __init__(self, type, value):
         #token type: INTEGER, PLUS, or EOF
         self.type = type
@@ -21,6 +29,30 @@ class Token(object):
     def __repre__(self):
         return self.__str__()
 
+class SharedToken(Token):
+    # Immutable, so one instance can stand for every occurrence of a lexeme
+    __slots__ = ()
+
+    def __init__(self, type, value):
+        object.__setattr__(self, 'type', type)
+        object.__setattr__(self, 'value', value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('SharedToken is immutable')
+
+    def __reduce__(self):
+        # pickling and deepcopy go through here, not __setattr__
+        return (SharedToken, (self.type, self.value))
+
+# Flyweights: one shared Token per fixed-spelling lexeme
+FIXED_TOKENS = {
+    '+': SharedToken(PLUS, '+'),
+    '-': SharedToken(MINUS, '-'),
+    '*': SharedToken(MUL, '*'),
+    '/': SharedToken(DIV, '/'),
+}
+EOF_TOKEN = SharedToken(EOF, None)
+
 class Lexer(object):
     def __init__(self, text):
         self.text = text
@@ -60,25 +92,54 @@ class Lexer(object):
             elif self.current_char.isdigit():
                 return Token(INTEGER, self.integer())
                 
-            elif self.current_char == '+':
-                self.advance()
-                return Token(PLUS, '+')
-                
-            elif self.current_char == '-':
-                self.advance()
-                return Token(MINUS, '-')
-            
-            elif self.current_char == '*':
-                self.advance()
-                return Token(MUL, '*')
-                
-            elif self.current_char == '/':
+            else:
+                token = FIXED_TOKENS.get(self.current_char)
+                if token is None:
+                    self.error("Current_char is " + self.current_char)
                 self.advance()
-                return Token(DIV, '/')
-            else:               
-                self.error("Current_char is " + self.current_char)
+                return token
             
-        return Token(EOF, None)
+        return EOF_TOKEN
+
+    def tokenize(self):
+        '''
+        Lex the whole text into a TokenBuffer, ending with EOF
+        '''
+        buffer = TokenBuffer()
+        while True:
+            self.skip_whitespace()
+            start = self.pos
+            token = self.get_next_token()
+            buffer.append(token.type, token.value, start)
+            if token.type == EOF:
+                return buffer
+
+class TokenBuffer(object):
+    '''
+    Struct-of-arrays token storage: a small-int type code, a value and a
+    start offset per token, instead of one Token object per lexeme
+    '''
+    def __init__(self):
+        self.types = array('b')
+        self.values = []
+        self.starts = array('l')
+
+    def __len__(self):
+        return len(self.types)
+
+    def append(self, type, value, start):
+        self.types.append(TYPE_CODES[type])
+        self.values.append(value)
+        self.starts.append(start)
+
+    def token(self, index):
+        type = TOKEN_TYPES[self.types[index]]
+        value = self.values[index]
+        if type == INTEGER:
+            return Token(INTEGER, value)
+        elif type == EOF:
+            return EOF_TOKEN
+        return FIXED_TOKENS[value]
         
 class Interpreter(object):
     def __init__(self, lexer):
@@ -100,7 +161,6 @@ class Interpreter(object):
     def term(self):
         token = self.current_token
         self.eat(INTEGER)
-        print("INTEGER " + str(token))
         return token.value
         
     def expr(self):
@@ -132,18 +192,36 @@ class Interpreter(object):
                 result = result / self.term()
             else:
                 self.error('Unknow op ' + str(op))
-            print("Op " + str(op))
         return result
     
+class BufferedInterpreter(Interpreter):
+    '''
+    Interpreter that walks a TokenBuffer by index instead of calling
+    lexer.get_next_token() for every token
+    '''
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.index = 0
+        self.current_token = buffer.token(0)
+
+    def eat(self, token_type):
+        if self.current_token.type == token_type:
+            self.index += 1
+            self.current_token = self.buffer.token(self.index)
+        else:
+            self.error('self.current_token:'+str(self.current_token)+', expected token_type is ' + token_type)
+
+
 def main():
     while True:
         try:
-            text = raw_input('calc > ')
+            text = input('calc > ')
         except EOFError:
             break
         if not text:
             continue
         lexer = Lexer(text)
+        trace_lexer(lexer, print_listener)
         interpreter = Interpreter(lexer)
         result = interpreter.expr()
         print(result)
@@ -1,7 +1,15 @@
+from array import array
+
+from cache import ParseCache
+
 INTEGER, PLUS, MINUS, MUL, DIV, LPAREN, RPAREN, EOF = ('INTEGER', 'PLUS', 'MINUS', 'MUL', 'DIV', 'LPAREN', 'RPAREN', 'EOF')
+TOKEN_TYPES = (INTEGER, PLUS, MINUS, MUL, DIV, LPAREN, RPAREN, EOF)  # index in this tuple is the type code
+TYPE_CODES = dict((type, code) for code, type in enumerate(TOKEN_TYPES))
 
 #=================Lexer=============================
 class Token(object):
+    __slots__ = ('type', 'value')
+
     def __init__(self, type, value):
         #token type: INTEGER, PLUS, or EOF
         self.type = type
@@ -21,6 +29,32 @@ class Token(object):
         
     def __repre__(self):
         return self.__str__()
+
+class SharedToken(Token):
+    # Immutable, so one instance can stand for every occurrence of a lexeme
+    __slots__ = ()
+
+    def __init__(self, type, value):
+        object.__setattr__(self, 'type', type)
+        object.__setattr__(self, 'value', value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('SharedToken is immutable')
+
+    def __reduce__(self):
+        # pickling and deepcopy go through here, not __setattr__
+        return (SharedToken, (self.type, self.value))
+
+# Flyweights: one shared Token per fixed-spelling lexeme
+FIXED_TOKENS = {
+    '+': SharedToken(PLUS, '+'),
+    '-': SharedToken(MINUS, '-'),
+    '*': SharedToken(MUL, '*'),
+    '/': SharedToken(DIV, '/'),
+    '(': SharedToken(LPAREN, '('),
+    ')': SharedToken(RPAREN, ')'),
+}
+EOF_TOKEN = SharedToken(EOF, None)
    
 class Lexer(object):
     def __init__(self, text):
@@ -61,34 +95,54 @@ class Lexer(object):
             elif self.current_char.isdigit():
                 return Token(INTEGER, self.integer())
                 
-            elif self.current_char == '+':
-                self.advance()
-                return Token(PLUS, '+')
-                
-            elif self.current_char == '-':
-                self.advance()
-                return Token(MINUS, '-')
-            
-            elif self.current_char == '*':
-                self.advance()
-                return Token(MUL, '*')
-                
-            elif self.current_char == '/':
-                self.advance()
-                return Token(DIV, '/')
-                
-            elif self.current_char == '(':
-                self.advance()
-                return Token(LPAREN, '(')
-                
-            elif self.current_char == ')':
+            else:
+                token = FIXED_TOKENS.get(self.current_char)
+                if token is None:
+                    self.error("Current_char is " + self.current_char)
                 self.advance()
-                return Token(RPAREN, ')')
-                
-            else:               
-                self.error("Current_char is " + self.current_char)
+                return token
             
-        return Token(EOF, None)
+        return EOF_TOKEN
+
+    def tokenize(self):
+        '''
+        Lex the whole text into a TokenBuffer, ending with EOF
+        '''
+        buffer = TokenBuffer()
+        while True:
+            self.skip_whitespace()
+            start = self.pos
+            token = self.get_next_token()
+            buffer.append(token.type, token.value, start)
+            if token.type == EOF:
+                return buffer
+
+class TokenBuffer(object):
+    '''
+    Struct-of-arrays token storage: a small-int type code, a value and a
+    start offset per token, instead of one Token object per lexeme
+    '''
+    def __init__(self):
+        self.types = array('b')
+        self.values = []
+        self.starts = array('l')
+
+    def __len__(self):
+        return len(self.types)
+
+    def append(self, type, value, start):
+        self.types.append(TYPE_CODES[type])
+        self.values.append(value)
+        self.starts.append(start)
+
+    def token(self, index):
+        type = TOKEN_TYPES[self.types[index]]
+        value = self.values[index]
+        if type == INTEGER:
+            return Token(INTEGER, value)
+        elif type == EOF:
+            return EOF_TOKEN
+        return FIXED_TOKENS[value]
  
 #================Parser============================
 class AST(object):
@@ -131,22 +185,19 @@ class Parser(object):
         token = self.current_token
         if token.type == INTEGER:
             self.eat(INTEGER)
-            print("INTEGER " + str(token))
-            return Num(token)
+            return self.make_num(token)
         elif token.type == LPAREN:
-            print("LPAREN " + str(token))
             self.eat(LPAREN)
             node = self.expr()
-            print("RPAREN " + str(self.current_token))
             self.eat(RPAREN)
             return node
         elif token.type == PLUS:
             self.eat(PLUS)
-            node = UnaryOp(token, self.factor())
+            node = self.make_unaryop(token, self.factor())
             return node
         elif token.type == MINUS:
             self.eat(MINUS)
-            node = UnaryOp(token, self.factor())
+            node = self.make_unaryop(token, self.factor())
             return node
         else:
             self.error("Unknown token in factor(): " + str(token))
@@ -166,7 +217,7 @@ class Parser(object):
             else:
                 self.error("Unknown token in term(): " + str(token))
             
-            node = BinOp(left=node, op=token, right=self.factor())
+            node = self.make_binop(left=node, op=token, right=self.factor())
                 
         return node
         
@@ -185,26 +236,82 @@ class Parser(object):
                 self.eat(MINUS)
             else:
                 self.error("Unknown token in expr(): " + str(token))
-            node = BinOp(left=node, op=token, right=self.term())
+            node = self.make_binop(left=node, op=token, right=self.term())
             
         return node
         
     def parse(self):
         return self.expr()
 
+    # Node construction goes through these, as in pascal9.Parser, so
+    # hooks.trace_parser can report the nodes
+    def make_binop(self, left, op, right):
+        return BinOp(left, op, right)
+
+    def make_num(self, token):
+        return Num(token)
+
+    def make_unaryop(self, op, expr):
+        return UnaryOp(op, expr)
+
+
+class BufferedParser(Parser):
+    '''
+    Parser that walks a TokenBuffer by index instead of calling
+    lexer.get_next_token() for every token
+    '''
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.index = 0
+        self.current_token = buffer.token(0)
+
+    def eat(self, token_type):
+        if self.current_token.type == token_type:
+            self.index += 1
+            self.current_token = self.buffer.token(self.index)
+        else:
+            self.error('self.current_token:'+str(self.current_token)+', expected token_type is ' + token_type)
 
 #=======================Interpreter===============================        
+class DispatchTable(dict):
+    '''
+    node type -> visit_ function of one visitor class. A node type is
+    resolved by name the first time it is seen and cached from then on.
+    '''
+    def __init__(self, visitor_class):
+        dict.__init__(self)
+        self.visitor_class = visitor_class
+
+    def __missing__(self, node_type):
+        handler = self.visitor_class.generic_visit
+        for klass in node_type.__mro__:
+            method = getattr(self.visitor_class, 'visit_' + klass.__name__, None)
+            if method is not None:
+                handler = method
+                break
+        self[node_type] = handler
+        return handler
+
 class NodeVisitor(object):
+    '''
+    Every visitor class gets its own DispatchTable, shared by all its
+    instances. Handlers that return values can skip the visit() call
+    and go through the table directly: self.dispatch[type(node)](self, node)
+    '''
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.dispatch = DispatchTable(cls)
+
     def visit(self, node):
-        method_name = 'visit_' + type(node).__name__
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
+        return self.dispatch[type(node)](self, node)
         
     def generic_visit(self, node):
         raise Exception('No visit_{} method'.format(type(node).__name__))
  
+NodeVisitor.dispatch = DispatchTable(NodeVisitor)
+
 class Interpreter(NodeVisitor):
-    def __init__(self, parser):
+    def __init__(self, parser=None):
         # Example: "3+5", " 71 - 15 "
         self.parser = parser
       
@@ -212,14 +319,17 @@ class Interpreter(NodeVisitor):
         raise Exception(msg)
         
     def visit_BinOp(self, node):
+        dispatch = self.dispatch
+        left = dispatch[type(node.left)](self, node.left)
+        right = dispatch[type(node.right)](self, node.right)
         if node.op.type == PLUS:
-            return self.visit(node.left) + self.visit(node.right)
+            return left + right
         elif node.op.type == MINUS:
-            return self.visit(node.left) - self.visit(node.right)
+            return left - right
         elif node.op.type == MUL:
-            return self.visit(node.left) * self.visit(node.right)
+            return left * right
         elif node.op.type == DIV:
-            return self.visit(node.left) / self.visit(node.right)
+            return left / right
         else:
             self.erorr("Unknown node op type: " + str(self.node.type))
     
@@ -228,28 +338,37 @@ class Interpreter(NodeVisitor):
         
     def visit_UnaryOp(self, node):
         op = node.op.type
+        value = self.dispatch[type(node.expr)](self, node.expr)
         if op == PLUS:
-            return +self.visit(node.expr)
+            return +value
         elif op == MINUS:
-            return -self.visit(node.expr)
+            return -value
     
-    def interpret(self):
-        tree = self.parser.parse()
+    def interpret(self, tree=None):
+        # tree: an already parsed tree, e.g. from parse_cached()
+        if tree is None:
+            tree = self.parser.parse()
         return self.visit(tree)
     
     
+PARSE_CACHE = ParseCache(lambda text: Parser(Lexer(text)).parse())
+
+def parse_cached(text):
+    '''
+    Parse text through PARSE_CACHE: a repeated text reuses its tree
+    '''
+    return PARSE_CACHE.parse(text)
+
 def main():
     while True:
         try:
-            text = raw_input('calc > ')
+            text = input('calc > ')
         except EOFError:
             break
         if not text:
             continue
-        lexer = Lexer(text)
-        parser = Parser(lexer)
-        interpreter = Interpreter(parser)
-        result = interpreter.interpret()
+        interpreter = Interpreter()
+        result = interpreter.interpret(parse_cached(text))
         print(result)
 
 def main2():
@@ -259,10 +378,8 @@ def main2():
     results = [10, 12, 22]
     
     for text in tests:
-        lexer = Lexer(text)
-        parser = Parser(lexer)
-        interpreter = Interpreter(parser)
-        result = interpreter.interpret()
+        interpreter = Interpreter()
+        result = interpreter.interpret(parse_cached(text))
         print(result)
         print ('='*20)
         
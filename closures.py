@@ -0,0 +1,138 @@
+'''
+Closure compilation backend for pascal9.
+
+The tree is walked once and turned into nested Python closures; every
+later run is a single call with no visitor dispatch left:
+
+    run = compile_tree(Parser(Lexer(text)).parse())
+    run(scope)
+'''
+import operator
+
+from pascal9 import NodeVisitor, Num, Var, NoOp, Compound, PLUS, MINUS, MUL, DIV
+
+BINARY_OPERATORS = {
+    PLUS: operator.add,
+    MINUS: operator.sub,
+    MUL: operator.mul,
+    DIV: operator.truediv,
+}
+
+UNARY_OPERATORS = {
+    PLUS: operator.pos,
+    MINUS: operator.neg,
+}
+
+# chains with more operators than this run as one loop over the operands
+CHAIN_LENGTH = 8
+
+class ClosureCompiler(NodeVisitor):
+    '''
+    visit_* returns a closure taking the scope dict. Operators and
+    variable names are resolved here, once, and literal or variable
+    operands are folded straight into their parent closure.
+    '''
+    binary_operators = BINARY_OPERATORS
+
+    def visit_BinOp(self, node):
+        # Parser.expr and term build left-leaning chains. A long chain
+        # compiles, without recursing down its left spine, into one
+        # closure that loops over its operands, so neither compiling nor
+        # running it grows the stack; short ones nest, which runs faster
+        spine = []
+        while type(node).__name__ == 'BinOp':
+            spine.append(node)
+            node = node.left
+        if len(spine) <= CHAIN_LENGTH:
+            return self.binop(spine[0])
+        dispatch = self.dispatch
+        operators = self.binary_operators
+        first = dispatch[type(node)](self, node)
+        steps = tuple((operators[node.op.type], dispatch[type(node.right)](self, node.right))
+                      for node in reversed(spine))
+        def chain(scope):
+            value = first(scope)
+            for op, right in steps:
+                value = op(value, right(scope))
+            return value
+        return chain
+
+    def binop(self, node):
+        op = self.binary_operators[node.op.type]
+        left, right = node.left, node.right
+        if isinstance(right, Num):
+            value = right.value
+            if isinstance(left, Var):
+                name = left.value
+                return lambda scope: op(scope[name], value)
+            left = self.dispatch[type(left)](self, left)
+            return lambda scope: op(left(scope), value)
+        if isinstance(right, Var):
+            name = right.value
+            if isinstance(left, Var):
+                left_name = left.value
+                return lambda scope: op(scope[left_name], scope[name])
+            left = self.dispatch[type(left)](self, left)
+            return lambda scope: op(left(scope), scope[name])
+        left = self.dispatch[type(left)](self, left)
+        right = self.dispatch[type(right)](self, right)
+        return lambda scope: op(left(scope), right(scope))
+
+    def visit_Num(self, node):
+        value = node.value
+        return lambda scope: value
+
+    def visit_UnaryOp(self, node):
+        op = UNARY_OPERATORS[node.op.type]
+        expr = self.dispatch[type(node.expr)](self, node.expr)
+        return lambda scope: op(expr(scope))
+
+    def visit_Compound(self, node):
+        children = tuple(self.visit(child) for child in self.statements(node))
+        def compound(scope):
+            for child in children:
+                child(scope)
+        return compound
+
+    def statements(self, node):
+        # nested BEGIN ... END blocks are flattened and empty statements
+        # dropped, so the compiled block is one flat loop
+        for child in node.children:
+            if isinstance(child, Compound):
+                for statement in self.statements(child):
+                    yield statement
+            elif not isinstance(child, NoOp):
+                yield child
+
+    def visit_NoOp(self, node):
+        return lambda scope: None
+
+    def visit_Assign(self, node):
+        name = node.left.value
+        right = node.right
+        if isinstance(right, Num):
+            value = right.value
+            def assign(scope):
+                scope[name] = value
+        else:
+            expr = self.dispatch[type(right)](self, right)
+            def assign(scope):
+                scope[name] = expr(scope)
+        return assign
+
+    def visit_Var(self, node):
+        name = node.value
+        return lambda scope: scope[name]
+
+def compile_tree(tree, compiler=ClosureCompiler):
+    '''
+    Compile a parsed pascal9 tree into run(scope). Reading an unset
+    variable raises NameError, as in Interpreter.visit_Var.
+    '''
+    body = compiler().visit(tree)
+    def run(scope):
+        try:
+            return body(scope)
+        except KeyError as e:
+            raise NameError(repr(e.args[0]))
+    return run
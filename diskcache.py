@@ -0,0 +1,179 @@
+'''
+Persistent on-disk cache of compiled pascal9 programs, in the spirit of
+__pycache__: one file per program holding its vm Bytecode, named after
+a hash of the source text and the compiler version.
+
+    cache = BytecodeCache('.p9cache')
+    execute(cache.compile(text), scope)
+'''
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+from pascal9 import Lexer, Parser
+from vm import Bytecode, compile_bytecode, VERSION
+
+SUFFIX = '.p9c'
+TEMP_SUFFIX = '.tmp'
+# a temporary file this old was left by a writer that died before renaming it
+TEMP_MAX_AGE = 3600
+ENTRY_MAGIC = b'P9CC'
+# magic, source digest, payload length, payload crc32
+ENTRY_HEADER = struct.Struct('<4s16sII')
+
+# bytecode and marshal formats both have to match for an entry to be usable
+CACHE_TAG = '{}-vm{}'.format(sys.implementation.cache_tag, VERSION).encode('ascii')
+
+def source_digest(text):
+    return hashlib.blake2b(CACHE_TAG + b'\0' + text.encode('utf-8', 'surrogatepass'),
+                           digest_size=16).digest()
+
+class BytecodeCache(object):
+    '''
+    Entries are validated on load: magic, source digest, length and
+    checksum must all match, else the file is treated as a miss and
+    removed. New entries are written to a temporary file and renamed
+    into place, so concurrent writers never expose a partial entry and
+    the last complete write wins.
+
+    max_size caps the total size of the entries in bytes. Loading an
+    entry touches its mtime, and trim() removes the least recently used
+    entries first, along with temporary files abandoned by writers that
+    were killed before renaming them.
+    '''
+    def __init__(self, directory, max_size=64 << 20):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for path, size, mtime in self.entries())
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest.hex() + SUFFIX)
+
+    def entries(self, suffix=SUFFIX):
+        # (path, size, mtime) of every entry, or of every file with suffix;
+        # files can disappear under us when another process trims the
+        # same directory
+        result = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            result.append((entry.path, stat.st_size, stat.st_mtime))
+        return result
+
+    def compile(self, text):
+        '''
+        Bytecode for text, from the cache if possible
+        '''
+        digest = source_digest(text)
+        bytecode = self.load(digest)
+        if bytecode is not None:
+            self.hits += 1
+            return bytecode
+        self.misses += 1
+        bytecode = compile_bytecode(Parser(Lexer(text)).parse())
+        self.store(digest, bytecode)
+        return bytecode
+
+    def load(self, digest):
+        path = self.path(digest)
+        try:
+            with open(path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    bytecode = self.decode(digest, data)
+        except FileNotFoundError:
+            return None
+        except (ValueError, EOFError, TypeError, struct.error):
+            # corrupt, truncated or foreign: drop it and recompile
+            self.size -= self.remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return bytecode
+
+    def decode(self, digest, data):
+        magic, stored_digest, length, checksum = ENTRY_HEADER.unpack_from(data)
+        if magic != ENTRY_MAGIC or stored_digest != digest:
+            raise ValueError('Not a cache entry for this source')
+        payload = data[ENTRY_HEADER.size:]
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            raise ValueError('Damaged cache entry')
+        return Bytecode.from_bytes(payload)
+
+    def store(self, digest, bytecode):
+        payload = bytecode.to_bytes()
+        header = ENTRY_HEADER.pack(ENTRY_MAGIC, digest, len(payload), zlib.crc32(payload))
+        path = self.path(digest)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=TEMP_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(payload)
+            # an entry replaced in place is only counted once
+            replaced = self.file_size(path)
+            os.replace(temp_path, path)
+        except BaseException:
+            self.remove(temp_path)
+            raise
+        self.size += len(header) + len(payload) - replaced
+        if self.size > self.max_size:
+            self.trim()
+
+    def trim(self):
+        stale = time.time() - TEMP_MAX_AGE
+        for path, size, mtime in self.entries(TEMP_SUFFIX):
+            if mtime < stale:
+                self.remove(path)
+        entries = self.entries()
+        entries.sort(key=lambda entry: entry[2])
+        self.size = sum(size for path, size, mtime in entries)
+        for path, size, mtime in entries:
+            if self.size <= self.max_size:
+                break
+            self.remove(path)
+            self.size -= size
+            self.evictions += 1
+
+    def file_size(self, path):
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def remove(self, path):
+        '''
+        Delete path if it is still there; returns the bytes freed
+        '''
+        size = self.file_size(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return size
+
+    def clear(self):
+        for path, size, mtime in self.entries():
+            self.remove(path)
+        self.size = 0
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
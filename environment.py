@@ -0,0 +1,207 @@
+'''
+Variable environments with cheap snapshots, for running many programs
+against the state one shared prelude leaves behind.
+
+An Environment is a dict of the variables written to it, over an
+optional frozen Snapshot it reads through to. Forking gives a new,
+empty Environment over a snapshot, so the variant sees everything the
+prelude defined, and its own assignments only go to its overlay:
+
+    prelude = Interpreter()
+    prelude.interpret(parse_cached(setup))
+    base = prelude.GLOBAL_SCOPE.snapshot()
+    for text in variants:
+        Interpreter(environment=Environment(base)).interpret(parse_cached(text))
+
+Both engines that take a scope dict (closures, stackeval, vm) and the
+visitor interpreters accept an Environment in place of a dict.
+'''
+
+class Snapshot(object):
+    '''
+    Frozen variables: values over parent. Neither is written again, so a
+    snapshot can be shared by any number of environments.
+
+    A lookup walks the chain from the top. To keep the chain short, a
+    new snapshot folds in every parent layer that is at most twice its
+    own size, so layers more than double in size going down: a chain
+    over n variables is at most log2(n) + 1 layers, and a small snapshot
+    on top of a large one copies only its own variables.
+    '''
+    __slots__ = ('values', 'parent')
+
+    def __init__(self, values, parent=None):
+        while parent is not None and len(parent.values) <= 2 * len(values):
+            merged = dict(parent.values)
+            merged.update(values)
+            values = merged
+            parent = parent.parent
+        self.values = values
+        self.parent = parent
+
+    def __bool__(self):
+        # only the top layer can be empty: a new snapshot always folds
+        # in an empty parent
+        return bool(self.values) or self.parent is not None
+
+    def lookup(self, name):
+        snapshot = self
+        while snapshot is not None:
+            values = snapshot.values
+            if name in values:
+                return values[name]
+            snapshot = snapshot.parent
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        snapshot = self
+        while snapshot is not None:
+            if name in snapshot.values:
+                return True
+            snapshot = snapshot.parent
+        return False
+
+    def as_dict(self):
+        layers = []
+        snapshot = self
+        while snapshot is not None:
+            layers.append(snapshot.values)
+            snapshot = snapshot.parent
+        merged = {}
+        for values in reversed(layers):
+            merged.update(values)
+        return merged
+
+class Environment(dict):
+    '''
+    Reads find the environment's own variables first, then the base
+    snapshot; writes always go to the environment's own variables. The
+    mapping methods (iteration, len, items, ...) and repr see both; C
+    code that reads the dict storage directly, like the json encoder,
+    does not, and should be given as_dict(). Equality compares both, as
+    a dict would. len() merges the chain; bool() does not.
+
+    Removing a variable that is in the base (del, pop, and popitem on
+    any environment with a base) first copies the base into the
+    environment's own variables, an O(n) step the usual assign-and-read
+    use never takes; clear() drops the base along with the rest.
+
+    snapshot() freezes the variables written since the last snapshot
+    and returns them, on top of the base, as the new base. It costs the
+    number of those variables, plus whatever Snapshot folds in, and
+    fork() only adds an empty environment over the result; reads from
+    the fork walk the snapshot chain, nothing is copied for them.
+    '''
+    def __init__(self, base=None, values=()):
+        dict.__init__(self, values)
+        self.base = base
+
+    def __missing__(self, name):
+        if self.base is None:
+            raise KeyError(name)
+        return self.base.lookup(name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or (self.base is not None and name in self.base)
+
+    def setdefault(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            self[name] = default
+            return default
+
+    def as_dict(self):
+        if self.base is None:
+            return dict(dict.items(self))
+        merged = self.base.as_dict()
+        merged.update(dict.items(self))
+        return merged
+
+    def keys(self):
+        return self.as_dict().keys()
+
+    def items(self):
+        if self.base is None:
+            return dict.items(self)
+        return self.as_dict().items()
+
+    def values(self):
+        return self.as_dict().values()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        if self.base is None:
+            return dict.__len__(self)
+        return len(self.as_dict())
+
+    def __bool__(self):
+        return dict.__len__(self) > 0 or (self.base is not None and bool(self.base))
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+    def thaw(self):
+        # move the base's variables into the overlay, keeping as_dict order
+        if self.base is not None:
+            overlay = dict(dict.items(self))
+            dict.clear(self)
+            dict.update(self, self.base.as_dict())
+            dict.update(self, overlay)
+            self.base = None
+
+    def __delitem__(self, name):
+        if self.base is not None and name in self.base:
+            self.thaw()
+        dict.__delitem__(self, name)
+
+    def pop(self, name, *default):
+        if self.base is not None and name in self.base:
+            self.thaw()
+        return dict.pop(self, name, *default)
+
+    def popitem(self):
+        self.thaw()
+        return dict.popitem(self)
+
+    def clear(self):
+        dict.clear(self)
+        self.base = None
+
+    def __eq__(self, other):
+        if isinstance(other, Environment):
+            other = other.as_dict()
+        elif not isinstance(other, dict):
+            return NotImplemented
+        return self.as_dict() == other
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def copy(self):
+        # the base is frozen and can be shared
+        return Environment(self.base, dict.items(self))
+
+    def snapshot(self):
+        if dict.__len__(self) or self.base is None:
+            self.base = Snapshot(dict(dict.items(self)), self.base)
+            dict.clear(self)
+        return self.base
+
+    def fork(self):
+        '''
+        A new environment starting from this one's current variables;
+        later writes to either are not seen by the other
+        '''
+        return Environment(self.snapshot())
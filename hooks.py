@@ -0,0 +1,187 @@
+'''
+Trace hooks for the lexers, parsers and interpreters of calc1 ... calc8,
+pascal9 and the engines built on them.
+
+A listener is any callable listener(event, *args). The events are
+
+    'token', token          a token produced by the lexer
+    'node', node            a node built by the parser (calc7, calc8 and
+                            pascal9 parsers, whose nodes come from the
+                            make_* factories)
+    'assign', name, value   an assignment made by the interpreter
+
+Tracing an object replaces the methods concerned on that one instance;
+the classes and every other instance are untouched, so there is nothing
+to pay when no listener is attached. Trace the lexer before building the
+parser, which reads the first token as it is constructed. calc1 ...
+calc3 lex inside the interpreter, so trace the interpreter as the lexer;
+calc1 ... calc6 evaluate while parsing and have tokens to report only.
+
+    recorder = RingRecorder(256)
+    lexer = Lexer(text)
+    trace_lexer(lexer, recorder)
+    parser = Parser(lexer)
+    trace_parser(parser, recorder)
+    interpreter = Interpreter(parser)
+    trace_interpreter(interpreter, recorder)
+    interpreter.interpret()
+    print('\\n'.join(recorder.dump()))
+
+Attaching several listeners to the same object stacks them; detach()
+them in the reverse order.
+'''
+import collections
+
+_MISSING = object()
+
+class Attachment(object):
+    '''
+    Instance attributes replaced on target; detach() puts back what was
+    there before
+    '''
+    def __init__(self, target):
+        self.target = target
+        self.saved = []
+
+    def replace(self, name, value):
+        self.saved.append((name, vars(self.target).get(name, _MISSING)))
+        setattr(self.target, name, value)
+
+    def detach(self):
+        while self.saved:
+            name, value = self.saved.pop()
+            if value is _MISSING:
+                delattr(self.target, name)
+            else:
+                setattr(self.target, name, value)
+
+def trace_lexer(lexer, listener):
+    '''
+    'token' for every token of get_next_token(), and for every token of
+    the buffer when the lexer has tokenize()
+    '''
+    attachment = Attachment(lexer)
+    get_next_token = lexer.get_next_token
+    depth = [0]
+    def traced_next():
+        # calc1 skips a space by calling get_next_token() again; only
+        # the outermost call reports its token
+        depth[0] += 1
+        try:
+            token = get_next_token()
+        finally:
+            depth[0] -= 1
+        if not depth[0]:
+            listener('token', token)
+        return token
+    attachment.replace('get_next_token', traced_next)
+    tokenize = getattr(lexer, 'tokenize', None)
+    if tokenize is not None:
+        def traced_tokenize():
+            # some tokenize() go through get_next_token() and some do not;
+            # the tokens are reported once, from the buffer
+            lexer.get_next_token = get_next_token
+            try:
+                buffer = tokenize()
+            finally:
+                lexer.get_next_token = traced_next
+            for index in range(len(buffer)):
+                listener('token', buffer.token(index))
+            return buffer
+        attachment.replace('tokenize', traced_tokenize)
+    return attachment
+
+def trace_parser(parser, listener):
+    '''
+    'node' for every node built through the parser's make_* factories
+    and empty(); a parser without them raises TypeError rather than
+    report nothing
+    '''
+    attachment = Attachment(parser)
+    for name in dir(type(parser)):
+        if name.startswith('make_') or name == 'empty':
+            attachment.replace(name, _traced_factory(getattr(parser, name), listener))
+    if not attachment.saved:
+        raise TypeError('{} builds no nodes through make_* factories'.format(type(parser).__name__))
+    return attachment
+
+def _traced_factory(factory, listener):
+    def traced(*args, **kwargs):
+        node = factory(*args, **kwargs)
+        listener('node', node)
+        return node
+    return traced
+
+class TracingTable(dict):
+    '''
+    node type -> handler of the table being traced, with the Assign
+    handler wrapped to report the assignment
+    '''
+    def __init__(self, table, listener):
+        dict.__init__(self)
+        self.table = table
+        self.listener = listener
+
+    def __missing__(self, node_type):
+        handler = self.table[node_type]
+        if node_type.__name__ == 'Assign':
+            handler = _traced_assign(handler, self.listener)
+        self[node_type] = handler
+        return handler
+
+def _traced_assign(handler, listener):
+    def traced(visitor, node):
+        result = handler(visitor, node)
+        variable = node.left
+        # read back through the visitor, wherever it keeps its variables
+        listener('assign', variable.value, visitor.dispatch[type(variable)](visitor, variable))
+        return result
+    return traced
+
+def trace_interpreter(interpreter, listener):
+    '''
+    'assign' after every assignment of a NodeVisitor based interpreter;
+    like profiling.VisitProfile, it gets its own dispatch table
+    '''
+    attachment = Attachment(interpreter)
+    attachment.replace('dispatch', TracingTable(interpreter.dispatch, listener))
+    return attachment
+
+class RingRecorder(object):
+    '''
+    Listener keeping the last capacity events as (event, args), for
+    inspection after the fact; seen counts every event received
+    '''
+    def __init__(self, capacity=1024):
+        self.events = collections.deque(maxlen=capacity)
+        self.seen = 0
+
+    def __call__(self, event, *args):
+        self.events.append((event, args))
+        self.seen += 1
+
+    def __len__(self):
+        return len(self.events)
+
+    @property
+    def dropped(self):
+        return self.seen - len(self.events)
+
+    def clear(self):
+        self.events.clear()
+        self.seen = 0
+
+    def dump(self):
+        return [format_event(event, *args) for event, args in self.events]
+
+def format_event(event, *args):
+    if event == 'token':
+        return 'token ' + str(args[0])
+    elif event == 'node':
+        return 'node ' + type(args[0]).__name__
+    elif event == 'assign':
+        return 'assign {} := {}'.format(*args)
+    return ' '.join([event] + [str(arg) for arg in args])
+
+def print_listener(event, *args):
+    print(format_event(event, *args))
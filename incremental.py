@@ -0,0 +1,242 @@
+'''
+Incremental reparsing of pascal9 sources.
+
+IncrementalParser keeps the text layout of the previous parse: for every
+BEGIN ... END block, the span of each statement between its semicolons.
+An edit is pushed down to the innermost block that contains it; only
+the statements it touches are re-lexed and re-parsed, and every other
+statement node is reused as is:
+
+    parser = IncrementalParser(text)
+    tree = parser.edit(start, end, replacement)
+    tree = parser.update(new_text)
+
+The tree returned is structurally equal to Parser(Lexer(text)).parse()
+of the whole new text. Unchanged subtrees are shared between successive
+trees, so they must not be modified.
+'''
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+from pascal9 import (Parser, RegexLexer, Compound, TOKEN_PATTERN,
+                     BEGIN, END, SEMI, DOT, EOF)
+
+class Block(object):
+    '''
+    Layout of a compound statement, relative to the start of its text.
+    head: length up to and including BEGIN (with leading whitespace)
+    spans: per statement, the length from its start to the start of the
+        next one (so including its ';'); the last runs up to END
+    blocks: per statement, its own Block if it is a compound statement
+    '''
+    __slots__ = ('head', 'spans', 'blocks')
+
+    def __init__(self, head, spans, blocks):
+        self.head = head
+        self.spans = spans
+        self.blocks = blocks
+
+class Unbalanced(Exception):
+    pass
+
+def scan(text, start, stop):
+    '''
+    (kind, start, end) per token of text[start:stop]; kind is BEGIN, END,
+    SEMI or DOT for the tokens that shape a program, else None
+    '''
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text, start, stop):
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'ID':
+            kind = BEGIN if value == 'BEGIN' else END if value == 'END' else None
+        elif value == ';':
+            kind = SEMI
+        elif value == '.':
+            kind = DOT
+        else:
+            kind = None
+        tokens.append((kind, match.start(match.lastgroup), match.end()))
+    return tokens
+
+def scan_statements(tokens, index, start, stop=None):
+    '''
+    Split the statements starting at tokens[index], at text offset start.
+    Stops at the END closing the list, or with stop=None at the end of the
+    tokens, the last statement then running up to stop.
+    Returns (spans, blocks, index of the END or len(tokens)).
+    '''
+    spans = []
+    blocks = []
+    nested = None
+    first = True
+    while index < len(tokens):
+        kind, token_start, token_end = tokens[index]
+        if kind == SEMI:
+            spans.append(token_end - start)
+            blocks.append(nested)
+            start = token_end
+            nested = None
+            first = True
+        elif kind == END:
+            spans.append(token_start - start)
+            blocks.append(nested)
+            return spans, blocks, index
+        elif kind == BEGIN:
+            inner_spans, inner_blocks, index = scan_statements(tokens, index + 1, token_end)
+            # a block only stands for a whole statement when it opens it;
+            # anything else is a syntax error the parser will report
+            nested = Block(token_end - start, inner_spans, inner_blocks) if first else None
+            first = False
+        else:
+            nested = None
+            first = False
+        index += 1
+    if stop is None:
+        raise Unbalanced()
+    spans.append(stop - start)
+    blocks.append(nested)
+    return spans, blocks, index
+
+def parse_statement(text):
+    parser = Parser(RegexLexer(text))
+    node = parser.statement()
+    if parser.current_token.type != EOF:
+        parser.error("Unexpected token after statement: " + str(parser.current_token))
+    return node
+
+def common_prefix(a, b, step=4096):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i:i + step] == b[i:i + step]:
+        i += step
+    while i < n and a[i] == b[i]:
+        i += 1
+    return min(i, n)
+
+def common_suffix(a, b, limit, step=4096):
+    # at most limit characters, so it cannot overlap the common prefix
+    i = 0
+    while i + step <= limit and a[len(a) - i - step:len(a) - i] == b[len(b) - i - step:len(b) - i]:
+        i += step
+    while i < limit and a[len(a) - i - 1] == b[len(b) - i - 1]:
+        i += 1
+    return i
+
+class IncrementalParser(object):
+    '''
+    text / tree: the current source and its tree
+    relexed: characters re-lexed by the last edit
+    reparsed: statements re-parsed by the last edit (None for a full parse)
+    '''
+    def __init__(self, text):
+        self.text = text
+        self.block = None
+        self.tree = None
+        self.parse_all()
+
+    def parse_all(self):
+        text = self.text
+        self.block = self.tree = None
+        self.relexed = len(text)
+        self.reparsed = None
+        tokens = scan(text, 0, len(text))
+        try:
+            if not tokens or tokens[0][0] != BEGIN:
+                raise Unbalanced()
+            spans, blocks, index = scan_statements(tokens, 1, tokens[0][2])
+            if [kind for kind, start, end in tokens[index + 1:]] != [DOT]:
+                raise Unbalanced()
+        except Unbalanced:
+            # not a program; the parser reports why
+            Parser(RegexLexer(text)).parse()
+            raise Exception('Syntax analysis error')
+        tree = Parser(RegexLexer(text)).parse()
+        self.block = Block(tokens[0][2], spans, blocks)
+        self.tree = tree
+        return tree
+
+    def update(self, text):
+        '''
+        Reparse for a new version of the whole text; the edit is the
+        span between the common prefix and the common suffix.
+        '''
+        old = self.text
+        start = common_prefix(old, text)
+        limit = min(len(old), len(text)) - start
+        suffix = common_suffix(old, text, limit)
+        return self.edit(start, len(old) - suffix, text[start:len(text) - suffix])
+
+    def edit(self, start, end, replacement):
+        '''
+        Replace text[start:end] with replacement and return the new tree
+        '''
+        old = self.text
+        self.text = old[:start] + replacement + old[end:]
+        if self.block is None:
+            # the last version did not parse
+            return self.parse_all()
+        delta = len(replacement) - (end - start)
+        self.relexed = 0
+        self.reparsed = 0
+        try:
+            result = self.edit_block(self.block, self.tree, 0, start, end, delta)
+        except Exception:
+            self.block = self.tree = None
+            raise
+        if result is None:
+            return self.parse_all()
+        self.block, self.tree = result
+        return self.tree
+
+    def edit_block(self, block, node, offset, start, end, delta):
+        '''
+        Apply the edit [start, end) (old offsets) to the block whose
+        statement starts at offset. Returns (new block, new node), or None
+        if the edit is not strictly inside the body of this block.
+        '''
+        spans = block.spans
+        last_index = len(spans) - 1
+        # bounds[i] is where statement i starts; bounds[-1] is the END
+        bounds = list(accumulate(spans, initial=offset + block.head))
+        # touching BEGIN or END could merge tokens with them
+        if start <= bounds[0] or end >= bounds[-1]:
+            return None
+        # statements whose text (without its ';') touches the edit
+        first = min(bisect_left(bounds, start + 1, 1) - 1, last_index)
+        last = bisect_right(bounds, end, 0, last_index + 1) - 1
+        if first == last and block.blocks[first] is not None:
+            result = self.edit_block(block.blocks[first], node.children[first], bounds[first], start, end, delta)
+            if result is not None:
+                inner_block, inner_node = result
+                return self.replace(block, node, first, last, [spans[first] + delta], [inner_block], [inner_node])
+        # re-lex and re-parse the touched statements in the new text
+        region_start = bounds[first]
+        region_stop = bounds[last + 1] + delta
+        if last < last_index:
+            region_stop -= 1  # the ';' after the region stays
+        tokens = scan(self.text, region_start, region_stop)
+        try:
+            new_spans, new_blocks, index = scan_statements(tokens, 0, region_start, region_stop)
+        except Unbalanced:
+            return None
+        if index != len(tokens):
+            return None  # an END without its BEGIN
+        self.relexed += region_stop - region_start
+        nodes = []
+        position = region_start
+        for span in new_spans[:-1]:
+            nodes.append(parse_statement(self.text[position:position + span - 1]))
+            position += span
+        nodes.append(parse_statement(self.text[position:region_stop]))
+        self.reparsed += len(nodes)
+        if last < last_index:
+            new_spans[-1] += 1
+        return self.replace(block, node, first, last, new_spans, new_blocks, nodes)
+
+    def replace(self, block, node, first, last, spans, blocks, nodes):
+        new_block = Block(block.head, block.spans[:first] + spans + block.spans[last + 1:],
+                          block.blocks[:first] + blocks + block.blocks[last + 1:])
+        new_node = Compound()
+        new_node.children = node.children[:first] + nodes + node.children[last + 1:]
+        return new_block, new_node
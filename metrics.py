@@ -0,0 +1,154 @@
+'''
+Phase-level metrics for the calc4 - calc8 and pascal9 front ends.
+
+Each phase runs on its own so it can be timed on its own: lex fills a
+TokenBuffer, parse builds the tree from it and interpret walks the tree.
+calc4 - calc6 evaluate while they parse, so there parse and interpret
+are one 'interpret' phase over the token buffer.
+
+    metrics = PhaseMetrics('pascal9')
+    measure(pascal9, text, metrics)
+    metrics.write_json('metrics.json')
+    metrics.write_prometheus('metrics.prom')
+
+    python metrics.py pascal9 program.pas --json metrics.json --prometheus metrics.prom
+'''
+import argparse
+import importlib
+import json
+import time
+
+class PhaseMetrics(object):
+    '''
+    Per phase: runs, wall time, tokens, tokens per second, and for the
+    phases that produce or walk a tree its node count and peak depth.
+    Recording the same phase again adds to it (depth keeps the maximum).
+    '''
+    def __init__(self, frontend):
+        self.frontend = frontend
+        self.phases = {}
+
+    def record(self, phase, seconds, tokens=None, nodes=None, depth=None):
+        entry = self.phases.get(phase)
+        if entry is None:
+            entry = self.phases[phase] = {'runs': 0, 'seconds': 0.0}
+        entry['runs'] += 1
+        entry['seconds'] += seconds
+        if tokens is not None:
+            entry['tokens'] = entry.get('tokens', 0) + tokens
+            if entry['seconds'] > 0:
+                entry['tokens_per_second'] = entry['tokens'] / entry['seconds']
+        if nodes is not None:
+            entry['nodes'] = entry.get('nodes', 0) + nodes
+        if depth is not None:
+            entry['depth'] = max(entry.get('depth', 0), depth)
+
+    def as_dict(self):
+        phases = dict((phase, dict(entry)) for phase, entry in self.phases.items())
+        return {'frontend': self.frontend, 'phases': phases}
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        '''
+        Prometheus text exposition format, one metric family per field,
+        labelled with the front end and the phase
+        '''
+        families = [
+            ('runs', 'calc_phase_runs_total', 'counter', 'Runs of the phase'),
+            ('seconds', 'calc_phase_seconds_total', 'counter', 'Wall time spent in the phase'),
+            ('tokens', 'calc_phase_tokens_total', 'counter', 'Tokens processed by the phase'),
+            ('tokens_per_second', 'calc_phase_tokens_per_second', 'gauge', 'Token throughput of the phase'),
+            ('nodes', 'calc_phase_ast_nodes_total', 'counter', 'AST nodes built or visited by the phase'),
+            ('depth', 'calc_phase_ast_depth', 'gauge', 'Peak AST depth seen by the phase'),
+        ]
+        lines = []
+        for field, name, kind, help in families:
+            samples = [(phase, entry[field]) for phase, entry in sorted(self.phases.items()) if field in entry]
+            if not samples:
+                continue
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for phase, value in samples:
+                lines.append('{}{{frontend="{}",phase="{}"}} {}'.format(name, self.frontend, phase, value))
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+
+    def write_prometheus(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_prometheus())
+
+def tree_size(tree, ast_class):
+    '''
+    (node count, depth) of a tree, walked without recursion
+    '''
+    nodes = 0
+    depth = 0
+    stack = [(tree, 1)]
+    while stack:
+        node, level = stack.pop()
+        nodes += 1
+        if level > depth:
+            depth = level
+        for value in vars(node).values():
+            if isinstance(value, ast_class):
+                stack.append((value, level + 1))
+            elif isinstance(value, list):
+                stack.extend((child, level + 1) for child in value)
+    return nodes, depth
+
+def measure(module, text, metrics=None):
+    '''
+    Run text through every phase of a front end module and record them;
+    returns the result of interpreting it
+    '''
+    if metrics is None:
+        metrics = PhaseMetrics(module.__name__)
+    clock = time.perf_counter
+
+    start = clock()
+    buffer = module.Lexer(text).tokenize()
+    metrics.record('lex', clock() - start, tokens=len(buffer))
+
+    if not hasattr(module, 'BufferedParser'):
+        start = clock()
+        result = module.BufferedInterpreter(buffer).expr()
+        metrics.record('interpret', clock() - start, tokens=len(buffer))
+        return result
+
+    start = clock()
+    tree = module.BufferedParser(buffer).parse()
+    elapsed = clock() - start
+    nodes, depth = tree_size(tree, module.AST)
+    metrics.record('parse', elapsed, tokens=len(buffer), nodes=nodes, depth=depth)
+
+    start = clock()
+    result = module.Interpreter(None).interpret(tree)
+    metrics.record('interpret', clock() - start, nodes=nodes, depth=depth)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-phase metrics for one calc4 - calc8 / pascal9 input')
+    parser.add_argument('frontend', choices=('calc4', 'calc5', 'calc6', 'calc7', 'calc8', 'pascal9'))
+    parser.add_argument('path', help='file holding the expression or program')
+    parser.add_argument('--json', help='write the metrics as JSON to this file')
+    parser.add_argument('--prometheus', help='write the metrics in Prometheus text format to this file')
+    args = parser.parse_args()
+    module = importlib.import_module(args.frontend)
+    with open(args.path) as f:
+        text = f.read()
+    metrics = PhaseMetrics(args.frontend)
+    measure(module, text, metrics)
+    if args.json:
+        metrics.write_json(args.json)
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus)
+    if not args.json and not args.prometheus:
+        print(metrics.to_json())
+
+if __name__ == '__main__':
+    main()
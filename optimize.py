@@ -0,0 +1,255 @@
+'''
+Optimisation passes over parsed calc7 / calc8 / pascal9 trees.
+
+Node types are matched by class name, so the same passes work on the
+trees of all three front ends:
+
+    tree, removed = fold_constants(Parser(Lexer(text)).parse())
+'''
+import operator
+
+from pascal9 import (NodeVisitor, BinOp, Num, UnaryOp, Compound, Assign, Var, FIXED_TOKENS, id_token,
+                     INTEGER, PLUS, MINUS, MUL, DIV)
+
+BINARY_OPERATORS = {
+    PLUS: operator.add,
+    MINUS: operator.sub,
+    MUL: operator.mul,
+    DIV: operator.truediv,
+}
+
+UNARY_OPERATORS = {
+    PLUS: operator.pos,
+    MINUS: operator.neg,
+}
+
+def is_num(node):
+    return type(node).__name__ == 'Num'
+
+def make_num(like, value):
+    # a Num of the same front end as the literal it replaces
+    return type(like)(type(like.token)(INTEGER, value))
+
+class ConstantFolder(NodeVisitor):
+    '''
+    Folds BinOp / UnaryOp subtrees whose operands are all literals into a
+    single Num. The input tree is not modified: changed nodes are rebuilt
+    and unchanged subtrees are shared. removed counts the nodes dropped.
+
+    Evaluation order and operators are exactly the interpreter's, so
+    folding never changes a result; / stays true division, and anything
+    that would raise at run time (division by zero, overflow) is left
+    in the tree to raise there.
+    '''
+    def __init__(self):
+        self.removed = 0
+
+    def fold(self, tree):
+        return self.visit(tree)
+
+    def visit_BinOp(self, node):
+        # Parser.expr and term build left-leaning chains; the left spine
+        # is walked with a loop, so a long chain takes no stack depth,
+        # and operands go through the dispatch table as in Interpreter
+        spine = []
+        while type(node).__name__ == 'BinOp':
+            spine.append(node)
+            node = node.left
+        dispatch = self.dispatch
+        left = dispatch[type(node)](self, node)
+        for node in reversed(spine):
+            left = self.binop(node, left, dispatch[type(node.right)](self, node.right))
+        return left
+
+    def binop(self, node, left, right):
+        if is_num(left) and is_num(right):
+            try:
+                value = BINARY_OPERATORS[node.op.type](left.value, right.value)
+            except ArithmeticError:
+                pass
+            else:
+                self.removed += 2
+                return make_num(left, value)
+        if left is node.left and right is node.right:
+            return node
+        return type(node)(left, node.op, right)
+
+    def visit_Num(self, node):
+        return node
+
+    def visit_UnaryOp(self, node):
+        expr = self.dispatch[type(node.expr)](self, node.expr)
+        if is_num(expr):
+            self.removed += 1
+            return make_num(expr, UNARY_OPERATORS[node.op.type](expr.value))
+        if expr is node.expr:
+            return node
+        return type(node)(node.op, expr)
+
+    def visit_Compound(self, node):
+        children = [self.visit(child) for child in node.children]
+        if all(new is old for new, old in zip(children, node.children)):
+            return node
+        root = type(node)()
+        root.children.extend(children)
+        return root
+
+    def visit_Assign(self, node):
+        right = self.dispatch[type(node.right)](self, node.right)
+        if right is node.right:
+            return node
+        return type(node)(node.left, node.op, right)
+
+    def visit_Var(self, node):
+        return node
+
+    def visit_NoOp(self, node):
+        return node
+
+def fold_constants(tree):
+    '''
+    Returns (folded tree, number of nodes removed)
+    '''
+    folder = ConstantFolder()
+    tree = folder.fold(tree)
+    return tree, folder.removed
+
+# Compiler-generated temporaries. pascal9 identifiers cannot start with
+# an underscore, so these never clash with program variables.
+TEMP_PREFIX = '_cse'
+
+def is_temporary(name):
+    return name.startswith(TEMP_PREFIX)
+
+class CommonSubexpressionEliminator(object):
+    '''
+    CSE over the statements of a pascal9 program, in execution order.
+
+    Every expression gets a value number from its operator and the value
+    numbers of its operands; a variable read takes the number of the
+    value last assigned to it. So after a := number, 10 * a and
+    10 * number share a number, while an entry that read a variable is
+    invalidated as soon as that variable is reassigned: the new read
+    has a new number and can no longer match.
+
+    The first pass counts each numbered BinOp / UnaryOp. The second
+    pass hoists the first occurrence of every repeated one into a
+    temporary (_cse0 := ...) right before its statement and replaces
+    all occurrences with a read of that temporary. Temporaries end up
+    in the scope like any other variable. Since a hoisted expression
+    runs before the rest of its statement, a program that fails may
+    report a different error first.
+    '''
+    def __init__(self):
+        self.reused = 0
+        self.temporaries = []
+
+    def eliminate(self, tree):
+        self.counts = {}
+        self.rewriting = False
+        self.start()
+        self.statements(tree)
+        self.rewriting = True
+        self.start()
+        self.temps = {}
+        return self.statements(tree)[0]
+
+    def start(self):
+        self.numbers = {}
+        self.variables = {}
+
+    def number(self, key):
+        value_number = self.numbers.get(key)
+        if value_number is None:
+            value_number = self.numbers[key] = len(self.numbers)
+        return value_number
+
+    def statements(self, node):
+        # Returns the statement as a list, preceded by any temporaries
+        # it needs. Nested blocks run in order, so numbering carries on
+        # through them.
+        if isinstance(node, Compound):
+            children = []
+            for child in node.children:
+                children.extend(self.statements(child))
+            if not self.rewriting or children == node.children:
+                return [node]
+            root = Compound()
+            root.children.extend(children)
+            return [root]
+        elif isinstance(node, Assign):
+            self.hoisted = []
+            value_number, right, inner = self.expression(node.right)
+            self.variables[node.left.value] = value_number
+            if right is not node.right:
+                node = Assign(node.left, node.op, right)
+            return self.hoisted + [node]
+        return [node]
+
+    def expression(self, node):
+        '''
+        Returns (value number, rewritten node, candidate value numbers
+        counted inside this occurrence)
+        '''
+        if isinstance(node, Num):
+            return self.number(('num', type(node.value), node.value)), node, []
+        elif isinstance(node, Var):
+            value_number = self.variables.get(node.value)
+            if value_number is None:
+                # the value the variable had before the program started
+                value_number = self.variables[node.value] = self.number(('input', node.value))
+            return value_number, node, []
+        elif isinstance(node, BinOp):
+            left_number, left, left_inner = self.expression(node.left)
+            right_number, right, right_inner = self.expression(node.right)
+            if node.op.type in (PLUS, MUL) and right_number < left_number:
+                # + and * commute exactly, for ints and floats alike
+                key = ('bin', node.op.type, right_number, left_number)
+            else:
+                key = ('bin', node.op.type, left_number, right_number)
+            if left is not node.left or right is not node.right:
+                node = BinOp(left, node.op, right)
+            return self.candidate(self.number(key), node, left_inner + right_inner)
+        elif isinstance(node, UnaryOp):
+            expr_number, expr, inner = self.expression(node.expr)
+            value_number = self.number(('unary', node.op.type, expr_number))
+            if expr is not node.expr:
+                node = UnaryOp(node.op, expr)
+            if isinstance(node.expr, (Num, Var)):
+                # a single negation is cheaper than a temporary
+                return value_number, node, inner
+            return self.candidate(value_number, node, inner)
+        raise Exception('No CSE for {}'.format(type(node).__name__))
+
+    def candidate(self, value_number, node, inner):
+        counts = self.counts
+        if not self.rewriting:
+            if counts.get(value_number):
+                # a repeat: the expressions inside it are covered by
+                # this one and should not count a second time
+                for inner_number in inner:
+                    counts[inner_number] -= 1
+                counts[value_number] += 1
+                return value_number, node, [value_number]
+            counts[value_number] = 1
+            inner.append(value_number)
+            return value_number, node, inner
+        if counts.get(value_number, 0) < 2:
+            return value_number, node, []
+        temp = self.temps.get(value_number)
+        if temp is None:
+            temp = self.temps[value_number] = TEMP_PREFIX + str(len(self.temporaries))
+            self.temporaries.append(temp)
+            self.hoisted.append(Assign(Var(id_token(temp)), FIXED_TOKENS[':='], node))
+        else:
+            self.reused += 1
+        return value_number, Var(id_token(temp)), []
+
+def eliminate_common_subexpressions(tree):
+    '''
+    Returns (rewritten tree, number of expressions replaced by a
+    read of an earlier result)
+    '''
+    eliminator = CommonSubexpressionEliminator()
+    tree = eliminator.eliminate(tree)
+    return tree, eliminator.reused
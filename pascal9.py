@@ -1,7 +1,19 @@
+import codecs
+import re
+from array import array
+
+from cache import ParseCache
+from environment import Environment
+from hooks import print_listener, trace_interpreter
+
 INTEGER, PLUS, MINUS, MUL, DIV, LPAREN, RPAREN, BEGIN, END, DOT, ASSIGN, SEMI, ID, EOF = ('INTEGER', 'PLUS', 'MINUS', 'MUL', 'DIV', 'LPAREN', 'RPAREN', 'BEGIN', 'END', 'DOT', 'ASSIGN', 'SEMI', 'ID', 'EOF')
+TOKEN_TYPES = (INTEGER, PLUS, MINUS, MUL, DIV, LPAREN, RPAREN, BEGIN, END, DOT, ASSIGN, SEMI, ID, EOF)  # index in this tuple is the type code
+TYPE_CODES = dict((type, code) for code, type in enumerate(TOKEN_TYPES))
 
 #=================Lexer=============================
 class Token(object):
+    __slots__ = ('type', 'value')
+
     def __init__(self, type, value):
         #token type: INTEGER, PLUS, or EOF
         self.type = type
@@ -22,25 +34,70 @@ class Token(object):
     def __repr__(self):
         return self.__str__()
 
+class SharedToken(Token):
+    # Immutable, so one instance can stand for every occurrence of a lexeme
+    __slots__ = ()
+
+    def __init__(self, type, value):
+        object.__setattr__(self, 'type', type)
+        object.__setattr__(self, 'value', value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('SharedToken is immutable')
+
+    def __reduce__(self):
+        # pickling and deepcopy go through here; names come back interned
+        if self.type == ID:
+            return (id_token, (self.value,))
+        return (SharedToken, (self.type, self.value))
+
+# Flyweights: one shared Token per fixed-spelling lexeme
+FIXED_TOKENS = {
+    ':=': SharedToken(ASSIGN, ':='),
+    '.': SharedToken(DOT, '.'),
+    ';': SharedToken(SEMI, ';'),
+    '+': SharedToken(PLUS, '+'),
+    '-': SharedToken(MINUS, '-'),
+    '*': SharedToken(MUL, '*'),
+    '/': SharedToken(DIV, '/'),
+    '(': SharedToken(LPAREN, '('),
+    ')': SharedToken(RPAREN, ')'),
+}
+EOF_TOKEN = SharedToken(EOF, None)
+
 RESERVED_KEYWORDS = {
-    'BEGIN': Token('BEGIN', 'BEGIN'),
-    'END': Token('END', 'END'),
+    'BEGIN': SharedToken('BEGIN', 'BEGIN'),
+    'END': SharedToken('END', 'END'),
 }
+
+# Interned ID tokens keyed by name, seeded with the reserved keywords so
+# one lookup resolves both. A long-running process can see any number of
+# distinct names, so the table starts over once it holds MAX_ID_TOKENS;
+# interning only saves memory, no code relies on token identity.
+ID_TOKENS = dict(RESERVED_KEYWORDS)
+MAX_ID_TOKENS = 1 << 16
+
+def id_token(name):
+    token = ID_TOKENS.get(name)
+    if token is None:
+        if len(ID_TOKENS) >= MAX_ID_TOKENS:
+            ID_TOKENS.clear()
+            ID_TOKENS.update(RESERVED_KEYWORDS)
+        token = ID_TOKENS[name] = SharedToken(ID, name)
+    return token
     
 class Lexer(object):
     
     def __init__(self, text):
         self.text = text
         self.pos = 0
-        self.current_char = self.text[self.pos]
+        self.current_char = self.text[self.pos] if self.text else None
     
     def _id(self):
-        result = ''
+        start = self.pos
         while self.current_char is not None and self.current_char.isalnum():
-            result += self.current_char
             self.advance()
-        token = RESERVED_KEYWORDS.get(result, Token(ID, result))
-        return token
+        return id_token(self.text[start:self.pos])
         
     def error(self, msg='Lexical analysis error'):
         raise Exception(msg)
@@ -88,45 +145,317 @@ class Lexer(object):
             elif self.current_char == ':' and self.peek() == '=':
                 self.advance()
                 self.advance()
-                return Token(ASSIGN, ':=')
-                
-            elif self.current_char == '.':
-                self.advance()
-                return Token(DOT, '.')
-                
-            elif self.current_char == ';':
-                self.advance()
-                return Token(SEMI, ';')
-                
-            elif self.current_char == '+':
-                self.advance()
-                return Token(PLUS, '+')
-                
-            elif self.current_char == '-':
-                self.advance()
-                return Token(MINUS, '-')
-            
-            elif self.current_char == '*':
-                self.advance()
-                return Token(MUL, '*')
+                return FIXED_TOKENS[':=']
                 
-            elif self.current_char == '/':
-                self.advance()
-                return Token(DIV, '/')
-                
-            elif self.current_char == '(':
-                self.advance()
-                return Token(LPAREN, '(')
-                
-            elif self.current_char == ')':
+            else:
+                token = FIXED_TOKENS.get(self.current_char)
+                if token is None:
+                    self.error("Current_char is " + self.current_char)
                 self.advance()
-                return Token(RPAREN, ')')
-                
-            else:               
-                self.error("Current_char is " + self.current_char)
+                return token
             
-        return Token(EOF, None)
- 
+        return EOF_TOKEN
+
+    def tokenize(self):
+        '''
+        Lex the whole text into a TokenBuffer, ending with EOF
+        '''
+        buffer = TokenBuffer()
+        while True:
+            self.skip_whitespace()
+            start = self.pos
+            token = self.get_next_token()
+            buffer.append(token.type, token.value, start)
+            if token.type == EOF:
+                return buffer
+
+class TokenBuffer(object):
+    '''
+    Struct-of-arrays token storage: a small-int type code, a value and a
+    start offset per token, instead of one Token object per lexeme
+    '''
+    def __init__(self):
+        self.types = array('b')
+        self.values = []
+        self.starts = array('l')
+
+    def __len__(self):
+        return len(self.types)
+
+    def append(self, type, value, start):
+        self.types.append(TYPE_CODES[type])
+        self.values.append(value)
+        self.starts.append(start)
+
+    def token(self, index):
+        type = TOKEN_TYPES[self.types[index]]
+        value = self.values[index]
+        if type == INTEGER:
+            return Token(INTEGER, value)
+        elif type in (ID, BEGIN, END):
+            return id_token(value)
+        elif type == EOF:
+            return EOF_TOKEN
+        return FIXED_TOKENS[value]
+
+
+# One master pattern for the whole token set. Leading whitespace is folded
+# into every match, so the scanner never loops just to skip blanks.
+TOKEN_PATTERN = re.compile(r'''
+    \s*(?:
+        (?P<INTEGER>\d+)
+      | (?P<ID>[^\W\d_][^\W_]*)
+      | (?P<OP>:=|[.;+\-*/()])
+      | (?P<MISMATCH>\S)
+    )''', re.VERBOSE)
+
+# Lexemes that are not separated by whitespace in the source. Spaced out
+# with str.replace, every lexeme of a regular text is one item of
+# str.split(); ':=' comes first, the others never touch ':' or '='.
+SPACED_LEXEMES = (':=', '.', ';', '+', '-', '*', '/', '(', ')')
+
+def split_lexemes(text):
+    for lexeme in SPACED_LEXEMES:
+        if lexeme in text:
+            text = text.replace(lexeme, ' ' + lexeme + ' ')
+    return text.split()
+
+class IrregularLexeme(Exception):
+    pass
+
+def lexeme_token(lexeme):
+    '''
+    The Token of one split item; an item that is not exactly one valid
+    lexeme ('12ab', 'a_b', ':', a stray character) raises IrregularLexeme
+    '''
+    if lexeme.isdecimal():
+        return SharedToken(INTEGER, int(lexeme))
+    token = FIXED_TOKENS.get(lexeme)
+    if token is None:
+        if not (lexeme[0].isalpha() and lexeme.isalnum()):
+            raise IrregularLexeme(lexeme)
+        token = id_token(lexeme)
+    return token
+
+class LexemeTable(dict):
+    # lexeme -> Token, filled in as the lexemes of one text are first seen
+    def __missing__(self, lexeme):
+        token = self[lexeme] = lexeme_token(lexeme)
+        return token
+
+class LexemeCodes(dict):
+    # lexeme -> type code, and values: lexeme -> token value, for one text
+    def __init__(self):
+        dict.__init__(self)
+        self.values = {}
+
+    def __missing__(self, lexeme):
+        token = lexeme_token(lexeme)
+        self.values[lexeme] = token.value
+        code = self[lexeme] = TYPE_CODES[token.type]
+        return code
+
+class ScannedTokenBuffer(TokenBuffer):
+    '''
+    TokenBuffer filled in bulk from text. The start offsets are only
+    found, with one TOKEN_PATTERN scan, when something asks for them.
+    '''
+    def __init__(self, text, types, values):
+        self.text = text
+        self.types = types
+        self.values = values
+        self._starts = None
+
+    @property
+    def starts(self):
+        if self._starts is None:
+            starts = array('l', [match.start(match.lastgroup) for match in TOKEN_PATTERN.finditer(self.text)])
+            starts.append(len(self.text))
+            self._starts = starts
+        return self._starts
+
+class RegexLexer(object):
+    '''
+    Bulk scanner producing the same Token stream as Lexer.
+
+    The text is cut into lexemes by str.split() once the operators are
+    spaced out, and each distinct lexeme is classified once through a
+    LexemeTable, so there is no regex match or Token built per token.
+    A text with an item that is not a single valid lexeme is scanned
+    with TOKEN_PATTERN instead, which also reports lexical errors at the
+    token they occur in.
+    pos is len(text) once a text has been split.
+    '''
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.get_next_token = self.tokens().__next__
+
+    def error(self, msg='Lexical analysis error'):
+        raise Exception(msg)
+
+    def tokens(self):
+        # the text is only split on the first token asked for, so
+        # tokenize() never pays for it
+        try:
+            tokens = list(map(LexemeTable().__getitem__, split_lexemes(self.text)))
+        except IrregularLexeme:
+            # never returns: it ends in EOF tokens
+            yield from self.scan_tokens()
+        self.pos = len(self.text)
+        yield from tokens
+        while True:
+            yield EOF_TOKEN
+
+    def scan_tokens(self):
+        # tokens() with TOKEN_PATTERN, one match per lexeme
+        for match in TOKEN_PATTERN.finditer(self.text):
+            kind = match.lastgroup
+            value = match.group(kind)
+            self.pos = match.end()
+            if kind == 'OP':
+                yield FIXED_TOKENS[value]
+            elif kind == INTEGER:
+                yield Token(INTEGER, int(value))
+            elif kind == ID:
+                yield id_token(value)
+            else:
+                self.error("Current_char is " + value)
+        self.pos = len(self.text)
+        while True:
+            yield EOF_TOKEN
+
+    def tokenize(self):
+        '''
+        Fill a TokenBuffer straight from the lexemes: the type code and
+        value of each distinct lexeme are found once, then mapped over all
+        '''
+        lexemes = split_lexemes(self.text)
+        codes = LexemeCodes()
+        try:
+            types = array('b', bytes(map(codes.__getitem__, lexemes)))
+        except IrregularLexeme:
+            return self.scan()
+        types.append(TYPE_CODES[EOF])
+        values = list(map(codes.values.__getitem__, lexemes))
+        values.append(None)
+        self.pos = len(self.text)
+        return ScannedTokenBuffer(self.text, types, values)
+
+    def scan(self):
+        '''
+        tokenize() with TOKEN_PATTERN, one match per lexeme
+        '''
+        buffer = TokenBuffer()
+        types, values, starts = buffer.types, buffer.values, buffer.starts
+        names = {}
+        for match in TOKEN_PATTERN.finditer(self.text):
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == 'OP':
+                kind = FIXED_TOKENS[value].type
+            elif kind == INTEGER:
+                value = int(value)
+            elif kind == ID:
+                if value in RESERVED_KEYWORDS:
+                    kind = RESERVED_KEYWORDS[value].type
+                # one string per distinct name, however often it is used
+                value = names.setdefault(value, value)
+            else:
+                self.error("Current_char is " + value)
+            types.append(TYPE_CODES[kind])
+            values.append(value)
+            starts.append(match.start(match.lastgroup))
+        buffer.append(EOF, None, len(self.text))
+        self.pos = len(self.text)
+        return buffer
+
+# characters read from a stream at a time
+CHUNK_SIZE = 1 << 16
+
+class StreamLexer(object):
+    '''
+    TOKEN_PATTERN scanner over a text or binary file object, a pipe or an
+    mmap, read chunk_size at a time, so the source never has to fit in
+    memory. Bytes are decoded incrementally with encoding.
+    pos is the character offset just after the last token.
+
+        Parser(StreamLexer(open(path, 'rb'))).parse()
+    '''
+    def __init__(self, source, chunk_size=CHUNK_SIZE, encoding='utf-8'):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.pos = 0
+        self.get_next_token = self.tokens().__next__
+
+    def error(self, msg='Lexical analysis error'):
+        raise Exception(msg)
+
+    def chunks(self):
+        decoder = None
+        while True:
+            data = self.source.read(self.chunk_size)
+            if not data:
+                break
+            if not isinstance(data, str):
+                # bytes from a binary file or an mmap; a character split
+                # across two reads is held back by the decoder
+                if decoder is None:
+                    decoder = codecs.getincrementaldecoder(self.encoding)()
+                data = decoder.decode(data)
+            if data:
+                yield data
+        if decoder is not None:
+            data = decoder.decode(b'', True)
+            if data:
+                yield data
+
+    def tokens(self):
+        chunks = self.chunks()
+        text = ''
+        offset = 0  # stream offset of text[0]
+        pos = 0
+        exhausted = False
+        while True:
+            match = TOKEN_PATTERN.match(text, pos)
+            # a match running up to the end of the text may continue in
+            # the next chunk (an identifier, a number, ':' of ':='), so it
+            # only counts once the stream is exhausted
+            if match is not None and (match.end() < len(text) or exhausted):
+                kind = match.lastgroup
+                value = match.group(kind)
+                pos = match.end()
+                self.pos = offset + pos
+                if kind == 'OP':
+                    yield FIXED_TOKENS[value]
+                elif kind == INTEGER:
+                    yield Token(INTEGER, int(value))
+                elif kind == ID:
+                    yield id_token(value)
+                else:
+                    self.error("Current_char is " + value)
+                continue
+            if exhausted:
+                break
+            chunk = next(chunks, None)
+            if chunk is None:
+                exhausted = True
+                continue
+            # keep only the unfinished tail, without leading whitespace
+            rest = text[pos:].lstrip()
+            offset += len(text) - len(rest)
+            text = rest + chunk
+            pos = 0
+        self.pos = offset + len(text)
+        while True:
+            yield EOF_TOKEN
+
+SCANNERS = {
+    'char': Lexer,
+    'regex': RegexLexer,
+}
+
 #================Parser============================
 class AST(object):
     pass
@@ -173,7 +502,12 @@ class Parser(object):
     def __init__(self, lexer):
         self.lexer = lexer
         self.current_token = self.lexer.get_next_token()
-        
+
+    @classmethod
+    def from_text(cls, text, scanner='char'):
+        # scanner: a key of SCANNERS, e.g. 'char' or 'regex'
+        return cls(SCANNERS[scanner](text))
+
     def error(self, msg='Syntax analysis error'):
         raise Exception(msg)
         
@@ -195,10 +529,7 @@ class Parser(object):
         nodes = self.statement_list()
         self.eat(END)
         
-        root = Compound()
-        for node in nodes:
-            root.children.append(node)
-        return root
+        return self.make_compound(nodes)
         
     def statement_list(self):
         # statement_list: statement | statement SEMI statement_list
@@ -231,12 +562,12 @@ class Parser(object):
         token = self.current_token
         self.eat(ASSIGN)
         right = self.expr()
-        node = Assign(left, token, right)
+        node = self.make_assign(left, token, right)
         return node
         
     def variable(self):
         #variable: ID
-        node = Var(self.current_token)
+        node = self.make_var(self.current_token)
         self.eat(ID)
         return node
         
@@ -254,22 +585,19 @@ class Parser(object):
         token = self.current_token
         if token.type == INTEGER:
             self.eat(INTEGER)
-            print("INTEGER " + str(token))
-            return Num(token)
+            return self.make_num(token)
         elif token.type == LPAREN:
-            print("LPAREN " + str(token))
             self.eat(LPAREN)
             node = self.expr()
-            print("RPAREN " + str(self.current_token))
             self.eat(RPAREN)
             return node
         elif token.type == PLUS:
             self.eat(PLUS)
-            node = UnaryOp(token, self.factor())
+            node = self.make_unaryop(token, self.factor())
             return node
         elif token.type == MINUS:
             self.eat(MINUS)
-            node = UnaryOp(token, self.factor())
+            node = self.make_unaryop(token, self.factor())
             return node
         elif token.type == ID:
             node = self.variable()
@@ -292,7 +620,7 @@ class Parser(object):
             else:
                 self.error("Unknown token in term(): " + str(token))
             
-            node = BinOp(left=node, op=token, right=self.factor())
+            node = self.make_binop(left=node, op=token, right=self.factor())
                 
         return node
         
@@ -311,7 +639,7 @@ class Parser(object):
                 self.eat(MINUS)
             else:
                 self.error("Unknown token in expr(): " + str(token))
-            node = BinOp(left=node, op=token, right=self.term())
+            node = self.make_binop(left=node, op=token, right=self.term())
             
         return node
         
@@ -322,38 +650,204 @@ class Parser(object):
             
         return node
 
+    # Node construction goes through these so ArenaParser can
+    # write nodes into a flat table instead
+    def make_binop(self, left, op, right):
+        return BinOp(left, op, right)
+
+    def make_num(self, token):
+        return Num(token)
+
+    def make_unaryop(self, op, expr):
+        return UnaryOp(op, expr)
+
+    def make_compound(self, nodes):
+        root = Compound()
+        for node in nodes:
+            root.children.append(node)
+        return root
+
+    def make_assign(self, left, op, right):
+        return Assign(left, op, right)
+
+    def make_var(self, token):
+        return Var(token)
+
+
+class BufferedParser(Parser):
+    '''
+    Parser that walks a TokenBuffer by index instead of calling
+    lexer.get_next_token() for every token
+    '''
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.index = 0
+        self.current_token = buffer.token(0)
+
+    def eat(self, token_type):
+        if self.current_token.type == token_type:
+            self.index += 1
+            self.current_token = self.buffer.token(self.index)
+        else:
+            self.error('self.current_token:'+str(self.current_token)+', expected token_type is ' + token_type)
+
+    @classmethod
+    def from_text(cls, text, scanner='char'):
+        return cls(SCANNERS[scanner](text).tokenize())
+
+# Binding powers of the infix operators: a higher power binds tighter.
+# An operator listed in RIGHT_ASSOCIATIVE groups a op b op c as a op (b op c).
+BINARY_POWERS = {
+    PLUS: 10,
+    MINUS: 10,
+    MUL: 20,
+    DIV: 20,
+}
+RIGHT_ASSOCIATIVE = set()
+# prefix operators bind tighter than any infix one, as in factor()
+PREFIX_POWERS = {
+    PLUS: 30,
+    MINUS: 30,
+}
+
+class PrattParser(Parser):
+    '''
+    Parser whose expr() is an iterative precedence-climbing loop over
+    an explicit operator stack instead of the expr -> term ->
+    factor descent. Nesting depth is bounded by memory, not by the
+    recursion limit, and the nodes are the same as Parser builds.
+
+    The operator tables are class attributes, so a subclass can add
+    operators (given tokens for them and an interpreter that knows them).
+    '''
+    binary_powers = BINARY_POWERS
+    right_associative = RIGHT_ASSOCIATIVE
+    prefix_powers = PREFIX_POWERS
+
+    def expr(self):
+        binary_powers = self.binary_powers
+        prefix_powers = self.prefix_powers
+        right_associative = self.right_associative
+        # pending operators as (power, token, left operand); prefix
+        # operators have no left operand, and an open '(' has power -1
+        # so no reduction ever goes past it
+        stack = []
+        while True:
+            # operand position: prefix operators and '(' until a primary
+            token = self.current_token
+            type = token.type
+            if type == INTEGER:
+                self.eat(INTEGER)
+                node = self.make_num(token)
+            elif type == ID:
+                self.eat(ID)
+                node = self.make_var(token)
+            elif type == LPAREN:
+                self.eat(LPAREN)
+                stack.append((-1, token, None))
+                continue
+            elif type in prefix_powers:
+                self.eat(type)
+                stack.append((prefix_powers[type], token, None))
+                continue
+            else:
+                self.error("Unknown token in factor(): " + str(token))
+
+            # operator position: close parentheses until an infix operator
+            while True:
+                token = self.current_token
+                type = token.type
+                power = binary_powers.get(type, 0)
+                if stack and stack[-1][0] >= power:
+                    # apply the pending operators that bind at least as tight
+                    bound = power + 1 if type in right_associative else power
+                    while stack and stack[-1][0] >= bound:
+                        top_power, op, left = stack.pop()
+                        if left is None:
+                            node = self.make_unaryop(op, node)
+                        else:
+                            node = self.make_binop(left, op, node)
+                if power:
+                    self.eat(type)
+                    stack.append((power, token, node))
+                    break
+                if stack:
+                    # only an open '(' can be left
+                    stack.pop()
+                    self.eat(RPAREN)
+                    continue
+                return node
 
 #=======================Interpreter===============================        
+class DispatchTable(dict):
+    '''
+    node type -> visit_ function of one visitor class. A node type is
+    resolved by name the first time it is seen and cached from then on.
+    '''
+    def __init__(self, visitor_class):
+        dict.__init__(self)
+        self.visitor_class = visitor_class
+
+    def __missing__(self, node_type):
+        handler = self.visitor_class.generic_visit
+        for klass in node_type.__mro__:
+            method = getattr(self.visitor_class, 'visit_' + klass.__name__, None)
+            if method is not None:
+                handler = method
+                break
+        self[node_type] = handler
+        return handler
+
 class NodeVisitor(object):
+    '''
+    Every visitor class gets its own DispatchTable, shared by all its
+    instances. Handlers that return values can skip the visit() call
+    and go through the table directly: self.dispatch[type(node)](self, node)
+    '''
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.dispatch = DispatchTable(cls)
+
     def visit(self, node):
-        method_name = 'visit_' + type(node).__name__
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
+        return self.dispatch[type(node)](self, node)
         
     def generic_visit(self, node):
         print (node)
         raise Exception('No visit_{} method'.format(type(node).__name__))
  
+NodeVisitor.dispatch = DispatchTable(NodeVisitor)
+
 class Interpreter(NodeVisitor):
     
-    GLOBAL_SCOPE = {}
-    
-    def __init__(self, parser):
+    def __init__(self, parser=None, environment=None):
         # Example: "3+5", " 71 - 15 "
         self.parser = parser
+        # every interpreter has its own variables unless it is given an
+        # Environment (or dict) to share
+        self.GLOBAL_SCOPE = Environment() if environment is None else environment
+
+    def fork(self, parser=None):
+        '''
+        An interpreter starting from this one's variables, see
+        Environment.fork()
+        '''
+        return type(self)(parser, self.GLOBAL_SCOPE.fork())
       
     def error(self, msg='Interpreter error'):
         raise Exception(msg)
         
     def visit_BinOp(self, node):
+        dispatch = self.dispatch
+        left = dispatch[type(node.left)](self, node.left)
+        right = dispatch[type(node.right)](self, node.right)
         if node.op.type == PLUS:
-            return self.visit(node.left) + self.visit(node.right)
+            return left + right
         elif node.op.type == MINUS:
-            return self.visit(node.left) - self.visit(node.right)
+            return left - right
         elif node.op.type == MUL:
-            return self.visit(node.left) * self.visit(node.right)
+            return left * right
         elif node.op.type == DIV:
-            return self.visit(node.left) / self.visit(node.right)
+            return left / right
         else:
             self.erorr("Unknown node op type: " + str(self.node.type))
     
@@ -362,10 +856,11 @@ class Interpreter(NodeVisitor):
         
     def visit_UnaryOp(self, node):
         op = node.op.type
+        value = self.dispatch[type(node.expr)](self, node.expr)
         if op == PLUS:
-            return +self.visit(node.expr)
+            return +value
         elif op == MINUS:
-            return -self.visit(node.expr)
+            return -value
             
     def visit_Compound(self, node):
         for child in node.children:
@@ -375,23 +870,31 @@ class Interpreter(NodeVisitor):
         pass
         
     def visit_Assign(self, node):
-        print ("Current GLOBAL_SCOPE:" + str(self.GLOBAL_SCOPE))
         var_name = node.left.value
         self.GLOBAL_SCOPE[var_name] = self.visit(node.right)
         
     def visit_Var(self, node):
         var_name = node.value
-        val = self.GLOBAL_SCOPE.get(var_name)
-        if val is None:
-            raise NameError(repr(var_name))
-        else:
-            return val
+        try:
+            return self.GLOBAL_SCOPE[var_name]
+        except KeyError:
+            raise NameError(repr(var_name)) from None
         
     
-    def interpret(self):
-        tree = self.parser.parse()
+    def interpret(self, tree=None):
+        # tree: an already parsed tree, e.g. from parse_cached()
+        if tree is None:
+            tree = self.parser.parse()
         return self.visit(tree)
 
+PARSE_CACHE = ParseCache(lambda text: Parser(Lexer(text)).parse())
+
+def parse_cached(text):
+    '''
+    Parse text through PARSE_CACHE: a repeated text reuses its tree
+    '''
+    return PARSE_CACHE.parse(text)
+
 def main():
     text = '''
     BEGIN
@@ -405,24 +908,21 @@ def main():
         x := 11;
     END.
     '''
-    lexer = Lexer(text)
-    parser = Parser(lexer)
-    interpreter = Interpreter(parser)
-    result = interpreter.interpret()
+    interpreter = Interpreter()
+    trace_interpreter(interpreter, print_listener)
+    result = interpreter.interpret(parse_cached(text))
     print("Final result: " + str(interpreter.GLOBAL_SCOPE))        
     
 def main1():
     while True:
         try:
-            text = raw_input('calc > ')
+            text = input('calc > ')
         except EOFError:
             break
         if not text:
             continue
-        lexer = Lexer(text)
-        parser = Parser(lexer)
-        interpreter = Interpreter(parser)
-        result = interpreter.interpret()
+        interpreter = Interpreter()
+        result = interpreter.interpret(parse_cached(text))
         print(result)
 
 def main2():
@@ -432,10 +932,8 @@ def main2():
     results = [10, 12, 22]
     
     for text in tests:
-        lexer = Lexer(text)
-        parser = Parser(lexer)
-        interpreter = Interpreter(parser)
-        result = interpreter.interpret()
+        interpreter = Interpreter()
+        result = interpreter.interpret(parse_cached(text))
         print(result)
         print ('='*20)
         
@@ -0,0 +1,126 @@
+'''
+Opt-in per-node-type and per-operator counters and timers for any
+NodeVisitor of calc7 / calc8 / pascal9.
+
+Instrumenting a visitor gives that one instance its own copy of the
+dispatch table with every handler wrapped in a timer; the class table
+and every other instance are untouched, so nothing is added to visit()
+when profiling is off:
+
+    interpreter = Interpreter(parser)
+    profile = VisitProfile.attach(interpreter)
+    interpreter.interpret()
+    print(profile.report())
+    profile.detach()
+'''
+import time
+
+# node types whose records are split per operator
+OPERATOR_NODES = ('BinOp', 'UnaryOp')
+
+class ProfilingTable(dict):
+    '''
+    node type -> timed wrapper of the handler the visitor class's own
+    table resolves for it
+    '''
+    def __init__(self, table, profile):
+        dict.__init__(self)
+        self.table = table
+        self.profile = profile
+
+    def __missing__(self, node_type):
+        handler = self.profile.wrap(node_type.__name__, self.table[node_type])
+        self[node_type] = handler
+        return handler
+
+class VisitProfile(object):
+    '''
+    records: (node type, operator or None) -> [calls, total, self]
+    Times are in seconds. Total time includes the nested visits (counted
+    once for a node type nested in itself), self time excludes them;
+    both include the timer's own overhead.
+    '''
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.records = {}
+        # time spent in nested visits, one entry per active visit
+        self.children = []
+        # key -> number of its visits in progress
+        self.active = {}
+        self.visitor = None
+
+    @classmethod
+    def attach(cls, visitor, *args, **kwargs):
+        profile = cls(*args, **kwargs)
+        profile.visitor = visitor
+        visitor.dispatch = ProfilingTable(type(visitor).dispatch, profile)
+        return profile
+
+    def detach(self):
+        # back to the class table
+        if self.visitor is not None:
+            del self.visitor.dispatch
+            self.visitor = None
+
+    def wrap(self, name, handler):
+        clock = self.clock
+        records = self.records
+        children = self.children
+        active = self.active
+        by_operator = name in OPERATOR_NODES
+        def timed(visitor, node):
+            key = (name, node.op.type if by_operator else None)
+            depth = active.get(key, 0)
+            active[key] = depth + 1
+            children.append(0.0)
+            start = clock()
+            try:
+                return handler(visitor, node)
+            finally:
+                elapsed = clock() - start
+                nested = children.pop()
+                if children:
+                    children[-1] += elapsed
+                active[key] = depth
+                record = records.get(key)
+                if record is None:
+                    record = records[key] = [0, 0.0, 0.0]
+                record[0] += 1
+                if not depth:
+                    # a recursive visit is already inside the outer total
+                    record[1] += elapsed
+                record[2] += elapsed - nested
+        return timed
+
+    def clear(self):
+        self.records.clear()
+
+    def by_node_type(self):
+        '''
+        {node type: (calls, total, self)} summed over operators; the
+        total then counts e.g. a PLUS nested in a MINUS in both
+        '''
+        totals = {}
+        for (name, op), (calls, total, own) in self.records.items():
+            summed = totals.get(name, (0, 0.0, 0.0))
+            totals[name] = (summed[0] + calls, summed[1] + total, summed[2] + own)
+        return totals
+
+    def stats(self):
+        '''
+        (node type, operator, calls, total, self) per record, by self
+        time, highest first
+        '''
+        rows = [(name, op, calls, total, own) for (name, op), (calls, total, own) in self.records.items()]
+        rows.sort(key=lambda row: row[4], reverse=True)
+        return rows
+
+    def report(self):
+        rows = self.stats()
+        all_self = sum(row[4] for row in rows) or 1.0
+        lines = ['{:<12} {:<8} {:>10} {:>12} {:>12} {:>7}'.format(
+            'node', 'op', 'calls', 'total ms', 'self ms', 'self %')]
+        for name, op, calls, total, own in rows:
+            lines.append('{:<12} {:<8} {:>10} {:>12.3f} {:>12.3f} {:>6.1f}%'.format(
+                name, op or '', calls, total * 1e3, own * 1e3, 100.0 * own / all_self))
+        return '\n'.join(lines)
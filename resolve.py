@@ -0,0 +1,173 @@
+'''
+Symbol resolution for pascal9: every distinct identifier gets an integer
+slot at compile time and the program runs against a preallocated list
+(the frame) instead of dict lookups in GLOBAL_SCOPE.
+
+    symbols = resolve(tree)
+    frame = symbols.frame()
+
+Slots are not written onto the parsed tree, whose subtrees may be shared
+with other trees (ParseCache, the optimizer passes, IncrementalParser)
+that number their variables differently. The resolver builds its own
+copy, symbols.tree, with a slot on every Var; only the Num and NoOp
+nodes, which carry no slot, are shared with the source tree.
+
+SlotInterpreter resolves a tree once, on its first run, and keeps the
+SymbolTable on the tree for every later run.
+'''
+from pascal9 import NodeVisitor, Interpreter, BinOp, UnaryOp, Compound, Assign, Var
+
+# marks a frame slot that has not been assigned yet
+UNSET = object()
+
+class SymbolTable(object):
+    '''
+    names[slot] is the identifier stored in that slot; free lists the
+    names read before any assignment to them, in execution order.
+    tree is the resolved copy of source, children the source's
+    statements at the time it was resolved
+    '''
+    def __init__(self):
+        self.names = []
+        self.slots = {}
+        self.free = []
+        self.source = None
+        self.children = None
+        self.tree = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def slot(self, name):
+        index = self.slots.get(name)
+        if index is None:
+            index = self.slots[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def matches(self, tree):
+        # the root of a tree is the one node a later change could modify
+        # in place; everything below it is copied into self.tree. Nodes
+        # compare by identity, so == on the lists is an identity check
+        return tree is self.source and getattr(tree, 'children', None) == self.children
+
+    def frame(self, scope=None, names=None):
+        # names: the ones to load from scope, by default all of them
+        frame = [UNSET] * len(self.names)
+        if scope is not None:
+            slots = self.slots
+            for name in self.names if names is None else names:
+                value = scope.get(name)
+                if value is not None:
+                    frame[slots[name]] = value
+        return frame
+
+    def export(self, frame, scope):
+        # write the assigned slots back to a dict scope
+        for index, value in enumerate(frame):
+            if value is not UNSET:
+                scope[self.names[index]] = value
+        return scope
+
+class SlotResolver(NodeVisitor):
+    '''
+    Walks the statements in execution order and returns a copy of each
+    node with a slot on every Var (including assignment targets); records
+    in symbols.free every variable read before any assignment to it.
+    Names in inputs count as assigned from the start, e.g. the variables
+    already in a scope.
+    '''
+    def __init__(self, inputs=()):
+        self.symbols = SymbolTable()
+        self.defined = set(inputs)
+
+    def resolve(self, tree):
+        symbols = self.symbols
+        symbols.source = tree
+        children = getattr(tree, 'children', None)
+        symbols.children = None if children is None else list(children)
+        symbols.tree = self.visit(tree)
+        return symbols
+
+    def visit_BinOp(self, node):
+        dispatch = self.dispatch
+        left = dispatch[type(node.left)](self, node.left)
+        right = dispatch[type(node.right)](self, node.right)
+        return BinOp(left, node.op, right)
+
+    def visit_Num(self, node):
+        return node
+
+    def visit_UnaryOp(self, node):
+        return UnaryOp(node.op, self.dispatch[type(node.expr)](self, node.expr))
+
+    def visit_Compound(self, node):
+        root = Compound()
+        root.children = [self.visit(child) for child in node.children]
+        return root
+
+    def visit_NoOp(self, node):
+        return node
+
+    def visit_Assign(self, node):
+        right = self.dispatch[type(node.right)](self, node.right)
+        left = Var(node.left.token)
+        left.slot = self.symbols.slot(left.value)
+        self.defined.add(left.value)
+        return Assign(left, node.op, right)
+
+    def visit_Var(self, node):
+        if node.value not in self.defined:
+            self.symbols.free.append(node.value)
+            self.defined.add(node.value)
+        var = Var(node.token)
+        var.slot = self.symbols.slot(node.value)
+        return var
+
+def resolve(tree, inputs=()):
+    '''
+    SymbolTable of tree; raises NameError for the first variable read
+    before it is assigned that is not in inputs
+    '''
+    symbols = SlotResolver(inputs).resolve(tree)
+    if symbols.free:
+        raise NameError(repr(symbols.free[0]))
+    return symbols
+
+def resolved(tree):
+    '''
+    SymbolTable of tree with no inputs, resolved on first use and kept
+    on the tree; resolved again if the tree's statements were replaced
+    since
+    '''
+    symbols = getattr(tree, 'symbols', None)
+    if symbols is None or not symbols.matches(tree):
+        symbols = tree.symbols = SlotResolver().resolve(tree)
+    return symbols
+
+class SlotInterpreter(Interpreter):
+    '''
+    Interpreter over a resolved tree: variables live in self.frame and
+    are read and written by slot index. Undefined variables are reported
+    before anything runs; GLOBAL_SCOPE is read once before and updated
+    once after the run. Only the tree's free variables are read from it.
+    '''
+    def interpret(self, tree=None):
+        if tree is None:
+            tree = self.parser.parse()
+        scope = self.GLOBAL_SCOPE
+        symbols = self.symbols = resolved(tree)
+        for name in symbols.free:
+            if scope.get(name) is None:
+                raise NameError(repr(name))
+        self.frame = symbols.frame(scope, symbols.free)
+        try:
+            return self.visit(symbols.tree)
+        finally:
+            self.symbols.export(self.frame, scope)
+
+    def visit_Assign(self, node):
+        self.frame[node.left.slot] = self.visit(node.right)
+
+    def visit_Var(self, node):
+        return self.frame[node.slot]
@@ -0,0 +1,264 @@
+'''
+Long-running evaluation service for calc8 expressions or pascal9
+programs over a TCP or Unix socket.
+
+    python server.py pascal9 --port 8765
+    python server.py calc8 --unix /tmp/calc8.sock
+
+    client = Client(('127.0.0.1', 8765))
+    client.evaluate('BEGIN a := 2 END.')    # {'a': 2}
+    client.evaluate('BEGIN b := a * 3 END.')    # {'a': 2, 'b': 6}
+    client.stats()
+
+Every connection is a session with its own variable scope, kept from
+one request to the next until the client clears it or disconnects.
+
+Protocol: a request is a 4-byte big-endian length followed by that many
+bytes, an opcode byte and the UTF-8 text:
+
+    E <text>    evaluate; the result is the value of an expression, or
+                the session scope after a program
+    C           clear the session scope
+    S           server counters and request latencies
+
+The response is a 4-byte big-endian length followed by a JSON object,
+{"ok": true, "result": ...} or {"ok": false, "error": "..."}. A failed
+program keeps the assignments it made before the error.
+
+Backpressure: a session's requests are handled one at a time, and the
+next one is not read before the response to the last one has been
+flushed, so a client that sends faster than it reads only fills its own
+socket buffers. Sessions beyond max_sessions and requests over
+max_request bytes are refused.
+'''
+import argparse
+import asyncio
+import bisect
+import json
+import socket
+import struct
+import time
+
+from cache import ParseCache
+from closures import compile_tree
+
+LANGUAGES = ('calc8', 'pascal9')
+HEADER = struct.Struct('>I')
+EVALUATE, CLEAR, STATS = b'E', b'C', b'S'
+MAX_REQUEST = 1 << 20
+MAX_SESSIONS = 1024
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+SAMPLES = {
+    'calc8': '-(1 + 2) * 3 / 4',
+    'pascal9': 'BEGIN a := -(1 + 2) * 3 / 4; b := a END.',
+}
+
+def encode(response):
+    return json.dumps(response).encode('utf-8')
+
+class LatencyStats(object):
+    '''
+    Request count, errors and latency: total, maximum and a cumulative
+    histogram over LATENCY_BUCKETS, as Prometheus histograms count
+    '''
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.requests = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max = 0.0
+
+    def record(self, seconds, ok=True):
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+        self.seconds += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def as_dict(self):
+        histogram = {}
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            histogram[str(bound)] = cumulative
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'seconds': self.seconds,
+            'mean': self.seconds / self.requests if self.requests else 0.0,
+            'max': self.max,
+            'buckets': histogram,
+        }
+
+class EvaluationServer(object):
+    '''
+    Evaluates through a ParseCache of closure-compiled programs, so a
+    text sent again by any session skips lexing, parsing and compiling
+    '''
+    def __init__(self, language, max_sessions=MAX_SESSIONS, max_request=MAX_REQUEST):
+        if language not in LANGUAGES:
+            raise ValueError('Unknown language {!r}, expected one of {}'.format(language, LANGUAGES))
+        if language == 'calc8':
+            from calc8 import Lexer, Parser
+        else:
+            from pascal9 import Lexer, Parser
+        self.language = language
+        self.programs = ParseCache(lambda text: compile_tree(Parser(Lexer(text)).parse()))
+        self.max_sessions = max_sessions
+        self.max_request = max_request
+        self.sessions = 0
+        self.refused = 0
+        self.latency = LatencyStats()
+        # fill the dispatch tables before the first client
+        self.run(SAMPLES[language], {})
+        self.programs.clear()
+
+    def run(self, text, scope):
+        value = self.programs.parse(text)(scope)
+        return dict(scope) if value is None else value
+
+    def evaluate(self, text, scope):
+        '''
+        The encoded response. The result is serialized here, so one JSON
+        cannot encode (an int over the str() digit limit) is an error
+        response like any failed program, not a dropped session.
+        '''
+        start = time.perf_counter()
+        try:
+            data = encode({'ok': True, 'result': self.run(text, scope)})
+            ok = True
+        except Exception as e:
+            data = encode({'ok': False, 'error': '{}: {}'.format(type(e).__name__, e)})
+            ok = False
+        self.latency.record(time.perf_counter() - start, ok)
+        return data
+
+    def stats(self):
+        return {
+            'language': self.language,
+            'sessions': self.sessions,
+            'refused': self.refused,
+            'cache': self.programs.stats(),
+            'latency': self.latency.as_dict(),
+        }
+
+    async def handle(self, reader, writer):
+        if self.sessions >= self.max_sessions:
+            self.refused += 1
+            await self.respond(writer, {'ok': False, 'error': 'too many sessions'})
+            writer.close()
+            return
+        self.sessions += 1
+        scope = {}
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                size, = HEADER.unpack(header)
+                if size > self.max_request:
+                    self.refused += 1
+                    await self.respond(writer, {'ok': False, 'error': 'request of {} bytes is over {}'.format(size, self.max_request)})
+                    break
+                payload = await reader.readexactly(size)
+                opcode = payload[:1]
+                if opcode == EVALUATE:
+                    try:
+                        text = payload[1:].decode('utf-8')
+                    except UnicodeDecodeError as e:
+                        data = encode({'ok': False, 'error': 'UnicodeDecodeError: {}'.format(e)})
+                    else:
+                        data = self.evaluate(text, scope)
+                elif opcode == CLEAR:
+                    scope.clear()
+                    data = encode({'ok': True, 'result': None})
+                elif opcode == STATS:
+                    data = encode({'ok': True, 'result': self.stats()})
+                else:
+                    data = encode({'ok': False, 'error': 'unknown opcode {!r}'.format(opcode)})
+                await self.send(writer, data)
+                # let the other sessions in between two requests of this one
+                await asyncio.sleep(0)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def respond(self, writer, response):
+        await self.send(writer, encode(response))
+
+    async def send(self, writer, data):
+        writer.write(HEADER.pack(len(data)) + data)
+        await writer.drain()
+
+    async def serve(self, host=None, port=None, path=None):
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+class Client(object):
+    '''
+    Blocking client for one session. address: a Unix socket path or a
+    (host, port) pair. Failed requests raise Exception with the error.
+    '''
+    def __init__(self, address):
+        if isinstance(address, str):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.connect(address)
+        self.file = self.socket.makefile('rwb')
+
+    def request(self, opcode, text=''):
+        payload = opcode + text.encode('utf-8')
+        self.file.write(HEADER.pack(len(payload)) + payload)
+        self.file.flush()
+        header = self.file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ConnectionError('connection closed by the server')
+        size, = HEADER.unpack(header)
+        response = json.loads(self.file.read(size).decode('utf-8'))
+        if not response['ok']:
+            raise Exception(response['error'])
+        return response['result']
+
+    def evaluate(self, text):
+        return self.request(EVALUATE, text)
+
+    def clear(self):
+        return self.request(CLEAR)
+
+    def stats(self):
+        return self.request(STATS)
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve calc8 or pascal9 evaluation over a socket')
+    parser.add_argument('language', choices=LANGUAGES)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on this Unix socket path instead of TCP')
+    parser.add_argument('--max-sessions', type=int, default=MAX_SESSIONS)
+    parser.add_argument('--max-request', type=int, default=MAX_REQUEST, help='largest request in bytes')
+    args = parser.parse_args()
+    server = EvaluationServer(args.language, args.max_sessions, args.max_request)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+'''
+Explicit-stack evaluation of calc7 / calc8 / pascal9 trees.
+
+The tree is walked in post order with a work stack and a value stack
+instead of recursive visit() calls, so neither the Python nor the C
+stack grows with the depth of the tree: the left-deep BinOp spine of a
+100k-term sum evaluates like any other tree.
+
+    value = evaluate(Parser(Lexer(text)).parse())
+    evaluate(program_tree, interpreter.GLOBAL_SCOPE)
+
+Node types are matched by class name, as in optimize.py.
+'''
+import operator
+
+NUM, VAR, BINOP, UNARYOP, COMPOUND, ASSIGN, NOOP = range(7)
+KIND_CODES = {
+    'Num': NUM,
+    'Var': VAR,
+    'BinOp': BINOP,
+    'UnaryOp': UNARYOP,
+    'Compound': COMPOUND,
+    'Assign': ASSIGN,
+    'NoOp': NOOP,
+}
+
+class KindTable(dict):
+    # node class -> kind code, resolved by name on first sight
+    def __missing__(self, node_type):
+        code = KIND_CODES.get(node_type.__name__)
+        if code is None:
+            raise Exception('No evaluation for {}'.format(node_type.__name__))
+        self[node_type] = code
+        return code
+
+KINDS = KindTable()
+
+BINARY_OPERATORS = {
+    'PLUS': operator.add,
+    'MINUS': operator.sub,
+    'MUL': operator.mul,
+    'DIV': operator.truediv,
+}
+UNARY_OPERATORS = {
+    'PLUS': operator.pos,
+    'MINUS': operator.neg,
+}
+
+# Work items that apply an operator to the values on top of the value
+# stack are tuples, which tells them apart from nodes:
+# (APPLY_BINARY, function), (APPLY_CONSTANT, function, right operand),
+# (APPLY_UNARY, function) and (APPLY_ASSIGN, name)
+APPLY_BINARY, APPLY_CONSTANT, APPLY_UNARY, APPLY_ASSIGN = range(4)
+
+def evaluate(tree, scope=None):
+    '''
+    Evaluate tree against scope (a dict, for pascal9 programs). Returns
+    the value of an expression, None for a program, as Interpreter does;
+    reading an unset variable raises NameError. Assignments are not
+    printed.
+    '''
+    if scope is None:
+        scope = {}
+    kinds = KINDS
+    values = []
+    push_value = values.append
+    pop_value = values.pop
+    work = [tree]
+    push = work.append
+    pop = work.pop
+    while work:
+        item = pop()
+        if type(item) is tuple:
+            action = item[0]
+            if action == APPLY_BINARY:
+                right = pop_value()
+                values[-1] = item[1](values[-1], right)
+            elif action == APPLY_CONSTANT:
+                values[-1] = item[1](values[-1], item[2])
+            elif action == APPLY_UNARY:
+                values[-1] = item[1](values[-1])
+            else:
+                scope[item[1]] = pop_value()
+            continue
+        kind = kinds[type(item)]
+        if kind == BINOP:
+            function = BINARY_OPERATORS[item.op.type]
+            right = item.right
+            if kinds[type(right)] == NUM:
+                # a literal right operand needs no work item of its own,
+                # and with a literal or variable on the left neither does
+                # the operator
+                left = item.left
+                left_kind = kinds[type(left)]
+                if left_kind == NUM:
+                    push_value(function(left.value, right.value))
+                elif left_kind == VAR:
+                    value = scope.get(left.value)
+                    if value is None:
+                        raise NameError(repr(left.value))
+                    push_value(function(value, right.value))
+                else:
+                    push((APPLY_CONSTANT, function, right.value))
+                    push(left)
+            else:
+                push((APPLY_BINARY, function))
+                push(right)
+                push(item.left)
+        elif kind == NUM:
+            push_value(item.value)
+        elif kind == VAR:
+            value = scope.get(item.value)
+            if value is None:
+                raise NameError(repr(item.value))
+            push_value(value)
+        elif kind == UNARYOP:
+            push((APPLY_UNARY, UNARY_OPERATORS[item.op.type]))
+            push(item.expr)
+        elif kind == COMPOUND:
+            work.extend(reversed(item.children))
+        elif kind == ASSIGN:
+            push((APPLY_ASSIGN, item.left.value))
+            push(item.right)
+    return values[-1] if values else None
@@ -0,0 +1,108 @@
+'''
+Transpile pascal9 trees to Python code objects.
+
+The tree is lowered to an ast.Module and compiled once; CPython's own
+bytecode evaluator then runs it against a scope mapping:
+
+    program = transpile(Parser(Lexer(text)).parse())
+    print(program.source)
+    program.run(scope)
+'''
+import ast
+import keyword
+
+from pascal9 import NodeVisitor, Compound, Assign, PLUS, MINUS, MUL, DIV
+
+BINARY_OPERATORS = {
+    PLUS: ast.Add,
+    MINUS: ast.Sub,
+    MUL: ast.Mult,
+    DIV: ast.Div,
+}
+
+UNARY_OPERATORS = {
+    PLUS: ast.UAdd,
+    MINUS: ast.USub,
+}
+
+# Names the generated code can use for itself; pascal9 identifiers
+# cannot start with an underscore, so these never clash with a variable
+SCOPE_NAME = '__scope__'
+
+class Transpiler(NodeVisitor):
+    '''
+    visit_* returns Python ast nodes; visit_Compound returns a list of
+    statements with nested blocks and empty statements flattened away.
+    '''
+    def visit_BinOp(self, node):
+        op = BINARY_OPERATORS[node.op.type]
+        return ast.BinOp(left=self.visit(node.left), op=op(), right=self.visit(node.right))
+
+    def visit_Num(self, node):
+        return ast.Constant(value=node.value)
+
+    def visit_UnaryOp(self, node):
+        op = UNARY_OPERATORS[node.op.type]
+        return ast.UnaryOp(op=op(), operand=self.visit(node.expr))
+
+    def visit_Compound(self, node):
+        statements = []
+        for child in node.children:
+            if isinstance(child, Compound):
+                statements.extend(self.visit(child))
+            elif isinstance(child, Assign):
+                statements.append(self.visit(child))
+        return statements
+
+    def visit_NoOp(self, node):
+        return []
+
+    def visit_Assign(self, node):
+        target = self.name(node.left.value, ast.Store())
+        return ast.Assign(targets=[target], value=self.visit(node.right))
+
+    def visit_Var(self, node):
+        return self.name(node.value, ast.Load())
+
+    def name(self, name, ctx):
+        # A pascal9 identifier can be a Python keyword ("if", "None", ...);
+        # those go through the scope mapping by subscript instead.
+        if keyword.iskeyword(name):
+            return ast.Subscript(value=ast.Name(id=SCOPE_NAME, ctx=ast.Load()),
+                                 slice=ast.Constant(value=name), ctx=ctx)
+        return ast.Name(id=name, ctx=ctx)
+
+class PythonProgram(object):
+    '''
+    A pascal9 tree compiled to a Python code object. run(scope) executes
+    it with scope as the local namespace: every assignment is written to
+    scope and reading an unset variable raises NameError, as Interpreter does.
+    '''
+    def __init__(self, tree, filename='<pascal9>'):
+        body = Transpiler().visit(tree)
+        if isinstance(body, list):
+            self.mode = 'exec'
+            self.module = ast.Module(body=body, type_ignores=[])
+        else:
+            # a bare expression: evaluate it and return its value
+            self.mode = 'eval'
+            self.module = ast.Expression(body=body)
+        ast.fix_missing_locations(self.module)
+        self.code = compile(self.module, filename, self.mode)
+
+    @property
+    def source(self):
+        return ast.unparse(self.module)
+
+    def run(self, scope):
+        # no builtins, so an unset name cannot resolve to e.g. abs or len
+        namespace = {'__builtins__': {}, SCOPE_NAME: scope}
+        try:
+            return eval(self.code, namespace, scope)
+        except NameError as e:
+            raise NameError(repr(e.name))
+        except KeyError as e:
+            raise NameError(repr(e.args[0]))
+
+def transpile(tree):
+    return PythonProgram(tree)
@@ -0,0 +1,110 @@
+'''
+Vectorised evaluation of one pascal9 program over columns of input
+bindings.
+
+Every input variable is bound to a NumPy array instead of a number, so
+each BinOp / UnaryOp runs once as a whole-array operation rather than
+once per row:
+
+    program = ColumnProgram(Parser(Lexer(text)).parse())
+    outputs = program.evaluate({'x': xs, 'y': ys})
+
+Columns are processed in chunks of chunk_size rows, which bounds the
+size of the temporaries an expression creates along the way.
+
+calc8 trees are accepted too, but calc8 has no variables: there is
+nothing to bind a column to, and the result is the expression's one
+constant value broadcast over length rows.
+'''
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from closures import BINARY_OPERATORS, ClosureCompiler, compile_tree
+from pascal9 import DIV
+
+CHUNK_SIZE = 1 << 16
+
+def column_divide(left, right):
+    # Python raises on any division by zero, 0 / 0 and inf / 0 included,
+    # which NumPy reports as invalid rather than divide; checking the
+    # divisor keeps the invalid flag for what it means in Python, a nan
+    if numpy.any(numpy.equal(right, 0)):
+        raise ZeroDivisionError('division by zero')
+    return numpy.true_divide(left, right)
+
+class ColumnCompiler(ClosureCompiler):
+    binary_operators = dict(BINARY_OPERATORS)
+    binary_operators[DIV] = column_divide
+
+def assigned_names(tree):
+    '''
+    Names assigned anywhere in tree, in order of first assignment
+    '''
+    names = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        kind = type(node).__name__
+        if kind == 'Compound':
+            stack.extend(reversed(node.children))
+        elif kind == 'Assign' and node.left.value not in names:
+            names.append(node.left.value)
+    return names
+
+class ColumnProgram(object):
+    '''
+    evaluate(columns) returns {name: array} with one array per assigned
+    variable, or for a bare calc8 expression the array of its values.
+
+    Arithmetic is NumPy's: / is true division as in Interpreter, and a
+    division by zero anywhere in a column raises ZeroDivisionError.
+    Other invalid float operations, inf - inf or inf * 0, give nan as
+    they do in Python. Integer columns are fixed width and wrap on
+    overflow where Python ints would grow.
+    '''
+    def __init__(self, tree, chunk_size=CHUNK_SIZE):
+        if numpy is None:
+            raise ImportError('vectorised evaluation needs numpy')
+        self.run = compile_tree(tree, ColumnCompiler)
+        self.names = assigned_names(tree)
+        self.chunk_size = chunk_size
+
+    def evaluate(self, columns, length=None):
+        '''
+        columns: {input variable: 1-d array}, all of the same length.
+        length is only needed when there are no columns at all.
+        '''
+        columns = dict((name, numpy.asarray(column)) for name, column in columns.items())
+        lengths = set(len(column) for column in columns.values())
+        if length is not None:
+            lengths.add(length)
+        if len(lengths) != 1:
+            raise ValueError('Columns must all have the same length, got {}'.format(sorted(lengths)))
+        length = lengths.pop()
+        outputs = {}
+        result = None
+        with numpy.errstate(invalid='ignore'):
+            # an empty input still runs once, so the outputs get their dtypes
+            for start in range(0, length or 1, self.chunk_size):
+                stop = min(start + self.chunk_size, length)
+                scope = dict((name, column[start:stop]) for name, column in columns.items())
+                value = self.run(scope)
+                for name in self.names:
+                    outputs[name] = self.column(outputs.get(name), scope[name], start, stop, length)
+                if value is not None:
+                    result = self.column(result, value, start, stop, length)
+        if result is not None:
+            return result
+        return outputs
+
+    def column(self, output, value, start, stop, length):
+        # constants come back as scalars and are broadcast over the chunk
+        if output is None:
+            output = numpy.empty(length, dtype=numpy.result_type(value))
+        output[start:stop] = value
+        return output
+
+def evaluate_columns(tree, columns, chunk_size=CHUNK_SIZE):
+    return ColumnProgram(tree, chunk_size).evaluate(columns)
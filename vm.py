@@ -0,0 +1,233 @@
+'''
+Stack-based bytecode VM for pascal9.
+
+A tree is compiled once into a Bytecode object: fixed-width
+(opcode, operand) pairs packed in an array('i'), a constant pool and a
+variable-slot table. execute() runs it in one flat dispatch loop, so
+evaluation needs no recursion and no per-node method lookup.
+
+    bytecode = compile_bytecode(Parser(Lexer(text)).parse())
+    print(disassemble(bytecode))
+    execute(bytecode, scope)
+'''
+import marshal
+import struct
+import sys
+from array import array
+
+from pascal9 import NodeVisitor, BinOp, UnaryOp, NoOp, PLUS, MINUS, MUL, DIV
+
+OPCODE_NAMES = ('LOAD_CONST', 'LOAD', 'STORE', 'ADD', 'SUB', 'MUL', 'DIV', 'POS', 'NEG', 'RETURN')
+LOAD_CONST, LOAD, STORE, ADD, SUB, MUL_OP, DIV_OP, POS, NEG, RETURN = range(len(OPCODE_NAMES))
+# opcodes whose operand indexes the constant pool / the slot table
+HAS_CONST = (LOAD_CONST,)
+HAS_SLOT = (LOAD, STORE)
+
+BINARY_OPCODES = {
+    PLUS: ADD,
+    MINUS: SUB,
+    MUL: MUL_OP,
+    DIV: DIV_OP,
+}
+
+UNARY_OPCODES = {
+    PLUS: POS,
+    MINUS: NEG,
+}
+
+MAGIC = b'P9BC'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+
+class Bytecode(object):
+    '''
+    code: array('i') of (opcode, operand) pairs
+    constants: constant pool, indexed by LOAD_CONST
+    names: variable name of each slot, indexed by LOAD/STORE
+    '''
+    def __init__(self, code, constants, names):
+        self.code = code
+        self.constants = constants
+        self.names = names
+
+    def __len__(self):
+        return len(self.code) // 2
+
+    def to_bytes(self):
+        code = array('i', self.code)
+        if sys.byteorder != 'little':
+            code.byteswap()
+        header = HEADER.pack(MAGIC, VERSION, len(code))
+        return header + code.tobytes() + marshal.dumps((self.constants, self.names))
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not pascal9 bytecode version {}'.format(VERSION))
+        start = HEADER.size
+        end = start + length * array('i').itemsize
+        code = array('i')
+        code.frombytes(data[start:end])
+        if sys.byteorder != 'little':
+            code.byteswap()
+        constants, names = marshal.loads(data[end:])
+        return cls(code, list(constants), list(names))
+
+class BytecodeCompiler(NodeVisitor):
+    '''
+    Emits code for a tree in post order: operands first, then the operator.
+    '''
+    def __init__(self):
+        self.code = array('i')
+        self.constants = []
+        self.constant_index = {}
+        self.names = []
+        self.slots = {}
+
+    def emit(self, opcode, operand=0):
+        self.code.append(opcode)
+        self.code.append(operand)
+
+    def constant(self, value):
+        # keyed by type too: 2 == 2.0, but they must not share a slot
+        key = (type(value), value)
+        index = self.constant_index.get(key)
+        if index is None:
+            index = self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def slot(self, name):
+        index = self.slots.get(name)
+        if index is None:
+            index = self.slots[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def compile(self, tree):
+        self.visit(tree)
+        self.emit(RETURN)
+        return Bytecode(self.code, self.constants, self.names)
+
+    def visit_BinOp(self, node):
+        self.expression(node)
+
+    def visit_Num(self, node):
+        self.emit(LOAD_CONST, self.constant(node.value))
+
+    def visit_UnaryOp(self, node):
+        self.expression(node)
+
+    def expression(self, root):
+        # Post order with an explicit stack, so the long left-leaning
+        # chains Parser.expr builds compile without recursion.
+        stack = [(root, False)]
+        while stack:
+            node, operands_done = stack.pop()
+            if isinstance(node, BinOp):
+                if operands_done:
+                    self.emit(BINARY_OPCODES[node.op.type])
+                else:
+                    stack.append((node, True))
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+            elif isinstance(node, UnaryOp):
+                if operands_done:
+                    self.emit(UNARY_OPCODES[node.op.type])
+                else:
+                    stack.append((node, True))
+                    stack.append((node.expr, False))
+            else:
+                self.visit(node)
+
+    def visit_Compound(self, node):
+        for child in node.children:
+            if not isinstance(child, NoOp):
+                self.visit(child)
+
+    def visit_NoOp(self, node):
+        pass
+
+    def visit_Assign(self, node):
+        self.visit(node.right)
+        self.emit(STORE, self.slot(node.left.value))
+
+    def visit_Var(self, node):
+        self.emit(LOAD, self.slot(node.value))
+
+def compile_bytecode(tree):
+    return BytecodeCompiler().compile(tree)
+
+def disassemble(bytecode):
+    lines = []
+    code = bytecode.code
+    for pc in range(0, len(code), 2):
+        opcode, operand = code[pc], code[pc + 1]
+        line = '{:6d} {:<12}'.format(pc // 2, OPCODE_NAMES[opcode])
+        if opcode in HAS_CONST:
+            line += '{:6d} ({!r})'.format(operand, bytecode.constants[operand])
+        elif opcode in HAS_SLOT:
+            line += '{:6d} ({})'.format(operand, bytecode.names[operand])
+        lines.append(line.rstrip())
+    return '\n'.join(lines)
+
+# marks a slot that has not been assigned yet
+UNSET = object()
+
+def execute(bytecode, scope):
+    '''
+    Run bytecode against scope: slots are loaded from scope first and
+    written back afterwards, also when evaluation fails.
+    Reading an unset variable raises NameError, as Interpreter does.
+    Returns the value left by an expression program, else None.
+    '''
+    code = bytecode.code
+    constants = bytecode.constants
+    names = bytecode.names
+    slots = [UNSET] * len(names)
+    for index, name in enumerate(names):
+        value = scope.get(name)
+        if value is not None:
+            slots[index] = value
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    # the instruction stream is straight-line, so it can be walked
+    # pairwise without a program counter
+    instructions = iter(code)
+    try:
+        for opcode, arg in zip(instructions, instructions):
+            if opcode == LOAD:
+                value = slots[arg]
+                if value is UNSET:
+                    raise NameError(repr(names[arg]))
+                push(value)
+            elif opcode == LOAD_CONST:
+                push(constants[arg])
+            elif opcode == STORE:
+                slots[arg] = pop()
+            elif opcode == ADD:
+                right = pop()
+                stack[-1] = stack[-1] + right
+            elif opcode == SUB:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif opcode == MUL_OP:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif opcode == DIV_OP:
+                right = pop()
+                stack[-1] = stack[-1] / right
+            elif opcode == NEG:
+                stack[-1] = -stack[-1]
+            elif opcode == POS:
+                stack[-1] = +stack[-1]
+            elif opcode == RETURN:
+                return stack[-1] if stack else None
+            else:
+                raise Exception('Unknown opcode {}'.format(opcode))
+    finally:
+        for index, value in enumerate(slots):
+            if value is not UNSET:
+                scope[names[index]] = value